@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from app.database import get_db, User
+from app.database import get_async_db, User
 from app.services.auth import UserService
 from app.models.auth import (
     UserCreate, UserLogin, Token, UserResponse, 
@@ -16,13 +16,13 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/register", response_model=UserResponse)
 async def register(
     user: UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Registrar nuevo usuario"""
     try:
         print(f"Intentando registrar usuario: {user.email}")
         user_service = UserService(db)
-        result = user_service.create_user(user)
+        result = await user_service.create_user(user)
         print(f"Usuario registrado exitosamente: {result.email}")
         return result
     except Exception as e:
@@ -35,11 +35,11 @@ async def register(
 @router.post("/login", response_model=Token)
 async def login(
     user_credentials: UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Iniciar sesión"""
     user_service = UserService(db)
-    user = user_service.authenticate_user(user_credentials.email, user_credentials.password)
+    user = await user_service.authenticate_user(user_credentials.email, user_credentials.password)
     
     if not user:
         raise HTTPException(
@@ -58,11 +58,11 @@ async def login(
 @router.get("/me", response_model=UserWithSettings)
 async def get_current_user_info(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener información del usuario actual"""
     user_service = UserService(db)
-    settings = user_service.get_user_settings(current_user.id)
+    settings = await user_service.get_user_settings(current_user.id)
     
     return UserWithSettings(
         id=current_user.id,
@@ -80,11 +80,11 @@ async def get_current_user_info(
 async def update_current_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualizar información del usuario actual"""
     user_service = UserService(db)
-    updated_user = user_service.update_user(current_user.id, user_update)
+    updated_user = await user_service.update_user(current_user.id, user_update)
     
     if not updated_user:
         raise HTTPException(
@@ -1,22 +1,41 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from app.models.chat import ChatRequest, ChatAnswer
-from app.repositories.mongo_chunk import MongoChunkRepository
-from app.services.embedding import EmbeddingService
-from app.services.llm import LLMService
 from app.services.chat import ChatService
+from app.core.container import ServiceContainer, get_container
+from app.core.sse import SSE_HEADERS, format_sse
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-def get_chat_service() -> ChatService:
-    """Factory para inyectar dependencias – puedes cambiar repo o LLM sin tocar el handler."""
-    repo = MongoChunkRepository()
-    emb = EmbeddingService()
-    llm = LLMService()
-    return ChatService(repo, emb, llm)
+def get_chat_service(container: ServiceContainer = Depends(get_container)) -> ChatService:
+    """Factory para inyectar dependencias – puedes cambiar repo o LLM sin tocar el handler."""
+    return container.chat_service()
 
 @router.post("", response_model=ChatAnswer, summary="Genera respuesta desde la KB")
 async def chat_endpoint(
     payload: ChatRequest,
     service: ChatService = Depends(get_chat_service),
 ) -> ChatAnswer:
-    return service.answer(payload.question)
+    return await service.aanswer(payload.question)
+
+@router.post("/stream", summary="Genera respuesta desde la KB en streaming (SSE)")
+async def chat_stream_endpoint(
+    payload: ChatRequest,
+    service: ChatService = Depends(get_chat_service),
+) -> StreamingResponse:
+    """Eventos: ``media`` (imágenes y videos), ``token`` por fragmento y ``done`` con la respuesta completa."""
+    media, tokens = await service.astream_answer(payload.question)
+
+    async def events():
+        yield format_sse("media", {"images": media.images, "videos": media.videos, "prompt_tokens": media.prompt_tokens})
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield format_sse("token", {"text": token})
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+            return
+        yield format_sse("done", {"answer": "".join(parts)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import anyio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.chat import ChatRequest, ChatAnswer
-from app.repositories.mongo_chunk import MongoChunkRepository
-from app.services.embedding import EmbeddingService
-from app.services.llm import LLMService
-from app.services.chat import ChatService
+from app.services.chat import ChatService, Retrieval
 from app.services.history import ChatHistoryService
-from app.database import get_db, User
+from app.database import get_async_db, AsyncSessionLocal, User
 from app.core.deps import get_current_active_user
+from app.core.config import get_settings
+from app.core.container import ServiceContainer, get_container
+from app.core.sse import SSE_HEADERS, format_sse
+from app.core.stages import StageGraph
 from app.services.user_settings import UserSettingsService
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
 
 router = APIRouter(prefix="/chat-history", tags=["Chat with History"])
 
@@ -21,67 +25,167 @@ class ChatWithHistoryRequest(BaseModel):
 class ChatWithHistoryResponse(ChatAnswer):
     session_id: int
 
-def get_chat_service(user_settings: dict = None) -> ChatService:
+def get_chat_service(container: ServiceContainer, user_settings: dict = None) -> ChatService:
     """Factory para inyectar dependencias – puedes cambiar repo o LLM sin tocar el handler."""
-    repo = MongoChunkRepository(user_settings)
-    emb = EmbeddingService()
-    llm = LLMService()
-    return ChatService(repo, emb, llm)
+    return container.chat_service(user_settings)
 
-@router.post("", response_model=ChatWithHistoryResponse, summary="Genera respuesta desde la KB con historial")
-async def chat_with_history_endpoint(
+async def _open_session(
     payload: ChatWithHistoryRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-) -> ChatWithHistoryResponse:
-    history_service = ChatHistoryService(db)
-    settings_service = UserSettingsService(db)
-    
-    # Obtener configuración del usuario
-    user_settings = settings_service.get_user_settings_dict(current_user.id)
-    
-    # Crear servicio con configuración del usuario
-    service = get_chat_service(user_settings)
-    
+    current_user: User,
+    history_service: ChatHistoryService,
+) -> Tuple[int, List[dict]]:
+    """Crea o valida la sesión, carga el historial y guarda la pregunta; devuelve (session_id, historial)."""
     # Si no hay session_id, crear una nueva sesión asociada al usuario
     if payload.session_id is None:
         title = history_service.generate_session_title(payload.question)
-        session = history_service.create_session(title, current_user.id)
+        session = await history_service.create_session(title, current_user.id)
         session_id = session.id
     else:
         session_id = payload.session_id
         # Verificar que la sesión pertenece al usuario
-        session = history_service.get_session(session_id)
+        session = await history_service.get_session(session_id)
         if not session or session.user_id != current_user.id:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Sesión no encontrada"
             )
     
-    # Obtener el historial de conversación para contexto
+    # Historial para contexto: resumen acumulado + últimos mensajes (sin leer la sesión entera)
     conversation_history = []
     if payload.session_id is not None:
-        messages = history_service.get_session_messages(session_id)
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages
-        ]
+        conversation_history = await history_service.get_conversation_context(
+            session, get_settings().history_recent_messages
+        )
     
     # Guardar el mensaje del usuario
-    history_service.add_message(session_id, "user", payload.question)
-    
-    # Generar respuesta con contexto de conversación y configuración del usuario
-    answer = service.answer(payload.question, conversation_history, user_settings)
-    
-    # Guardar la respuesta del asistente
-    history_service.add_message(session_id, "assistant", answer.answer)
+    await history_service.add_message(session_id, "user", payload.question)
+    return session_id, conversation_history
+
+def _context_graph(
+    payload: ChatWithHistoryRequest,
+    current_user: User,
+    db: AsyncSession,
+    container: ServiceContainer,
+) -> StageGraph:
+    """Etapas previas al LLM: configuración → (sesión/historial ‖ embedding y recuperación).
+
+    La recuperación sólo depende de la configuración del usuario, así que
+    corre a la vez que se valida la sesión, se lee el historial y se guarda la
+    pregunta. Las etapas de BD comparten la sesión SQLAlchemy (no admite
+    operaciones concurrentes) y por eso van una detrás de otra.
+    """
+    history_service = ChatHistoryService(db)
+
+    async def settings():
+        return await UserSettingsService(db).get_user_settings_dict(current_user.id)
+
+    async def session(settings):
+        return await _open_session(payload, current_user, history_service)
+
+    async def retrieval(settings):
+        return await get_chat_service(container, settings).aretrieve(payload.question, settings)
+
+    return (
+        StageGraph()
+        .add("settings", settings)
+        .add("session", session, after=["settings"])
+        .add("retrieval", retrieval, after=["settings"])
+    )
+
+@router.post("", response_model=ChatWithHistoryResponse, summary="Genera respuesta desde la KB con historial")
+async def chat_with_history_endpoint(
+    payload: ChatWithHistoryRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    container: ServiceContainer = Depends(get_container),
+) -> ChatWithHistoryResponse:
+    history_service = ChatHistoryService(db)
+
+    async def answer(settings: dict, session: Tuple[int, List[dict]], retrieval: Retrieval) -> ChatAnswer:
+        # Generar respuesta con contexto de conversación y configuración del usuario
+        service = get_chat_service(container, settings)
+        return await service.agenerate(payload.question, retrieval, session[1], settings)
+
+    async def save(session: Tuple[int, List[dict]], answer: ChatAnswer) -> None:
+        # Guardar la respuesta del asistente
+        await history_service.add_message(session[0], "assistant", answer.answer)
+
+    graph = (
+        _context_graph(payload, current_user, db, container)
+        .add("answer", answer, after=["settings", "session", "retrieval"])
+        .add("save", save, after=["session", "answer"])
+    )
+    results = await graph.run()
+    answer_result = results["answer"]
+    _schedule_summary(background_tasks, container, results["session"][0], results["settings"])
     
     # Crear respuesta con session_id
     response = ChatWithHistoryResponse(
-        answer=answer.answer,
-        images=answer.images,
-        videos=answer.videos,
-        session_id=session_id
+        answer=answer_result.answer,
+        images=answer_result.images,
+        videos=answer_result.videos,
+        prompt_tokens=answer_result.prompt_tokens,
+        session_id=results["session"][0]
     )
     
     return response
+
+def _schedule_summary(
+    background_tasks: BackgroundTasks,
+    container: ServiceContainer,
+    session_id: int,
+    user_settings: dict,
+) -> None:
+    """Actualiza el resumen de la sesión después de enviar la respuesta."""
+    if get_settings().history_summary_enabled:
+        background_tasks.add_task(container.summarizer.update, session_id, user_settings)
+
+async def _save_assistant_message(session_id: int, content: str) -> None:
+    """Guarda la respuesta con su propia sesión de BD: el stream termina después de la petición."""
+    async with AsyncSessionLocal() as db:
+        await ChatHistoryService(db).add_message(session_id, "assistant", content)
+
+@router.post("/stream", summary="Genera respuesta desde la KB con historial en streaming (SSE)")
+async def chat_with_history_stream_endpoint(
+    payload: ChatWithHistoryRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    container: ServiceContainer = Depends(get_container),
+) -> StreamingResponse:
+    """Eventos: ``media`` (imágenes, videos y session_id), ``token`` por fragmento y ``done``.
+
+    La respuesta del asistente se guarda en el historial al terminar el stream
+    (también la parcial si el cliente se desconecta).
+    """
+    context = await _context_graph(payload, current_user, db, container).run()
+    user_settings = context["settings"]
+    session_id, conversation_history = context["session"]
+    service = get_chat_service(container, user_settings)
+    media, tokens = service.generate_stream(payload.question, context["retrieval"], conversation_history, user_settings)
+
+    async def events():
+        yield format_sse("media", {"images": media.images, "videos": media.videos, "session_id": session_id, "prompt_tokens": media.prompt_tokens})
+        parts = []
+        completed = False
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield format_sse("token", {"text": token})
+            completed = True
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            if parts:
+                # Protegido de la cancelación: si el cliente se desconecta se guarda igualmente
+                with anyio.CancelScope(shield=True):
+                    await _save_assistant_message(session_id, "".join(parts))
+        if completed:
+            yield format_sse("done", {"answer": "".join(parts), "session_id": session_id})
+
+    # El resumen se actualiza cuando el stream termina (y la respuesta ya está guardada)
+    summary = (
+        BackgroundTask(container.summarizer.update, session_id, user_settings)
+        if get_settings().history_summary_enabled else None
+    )
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS, background=summary)
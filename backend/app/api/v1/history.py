@@ -1,87 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db, User
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.database import get_async_db, User
 from app.services.history import ChatHistoryService
 from app.core.deps import get_current_active_user
+from app.core.pagination import Position, decode_cursor, encode_cursor
 from app.models.history import (
     ChatSessionResponse, 
     ChatHistoryResponse, 
+    ChatHistoryPage,
     ChatSessionCreate,
-    ChatMessageResponse
+    ChatMessagePage
 )
 
 router = APIRouter(prefix="/history", tags=["Chat History"])
 
-@router.get("/sessions", response_model=List[ChatHistoryResponse])
+MAX_PAGE_SIZE = 200
+
+def _position(cursor: Optional[str]) -> Optional[Position]:
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _message_page(service: ChatHistoryService, session_id: int, limit: int, cursor: Optional[str]) -> ChatMessagePage:
+    """Página de mensajes más recientes que ``cursor`` (se pide uno de más para saber si hay otra)."""
+    messages = await service.get_recent_messages(session_id, limit + 1, _position(cursor))
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[1:]
+        next_cursor = encode_cursor(messages[0].created_at, messages[0].id)
+    return ChatMessagePage(items=messages, next_cursor=next_cursor)
+
+@router.get("/sessions", response_model=ChatHistoryPage)
 async def get_chat_sessions(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener todas las sesiones de chat con información resumida"""
+    """Sesiones de chat con información resumida, de la más reciente a la más antigua, por páginas"""
     service = ChatHistoryService(db)
-    sessions = service.get_user_sessions(current_user.id)
+    sessions = await service.get_user_sessions(current_user.id, limit + 1, _position(cursor))
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1].updated_at, sessions[-1].id)
     
-    result = []
-    for session in sessions:
-        # Contar mensajes y obtener preview del último mensaje
-        message_count = len(session.messages)
-        last_message_preview = None
-        
-        if session.messages:
-            # Obtener el último mensaje del usuario (no del asistente)
-            user_messages = [msg for msg in session.messages if msg.role == "user"]
-            if user_messages:
-                last_message_preview = user_messages[-1].content[:100]
-                if len(user_messages[-1].content) > 100:
-                    last_message_preview += "..."
-        
-        result.append(ChatHistoryResponse(
+    # Contador y preview vienen desnormalizados en la sesión: una sola consulta, sin cargar mensajes
+    items = [
+        ChatHistoryResponse(
             id=session.id,
             title=session.title,
             created_at=session.created_at,
             updated_at=session.updated_at,
-            message_count=message_count,
-            last_message_preview=last_message_preview
-        ))
-    
-    return result
+            message_count=session.message_count or 0,
+            last_message_preview=session.last_user_preview
+        )
+        for session in sessions
+    ]
+    return ChatHistoryPage(items=items, next_cursor=next_cursor)
 
 @router.get("/sessions/{session_id}", response_model=ChatSessionResponse)
 async def get_chat_session(
     session_id: int, 
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener una sesión específica con todos sus mensajes"""
+    """Obtener una sesión específica con sus últimos ``limit`` mensajes (los anteriores, vía ``next_cursor``)"""
     service = ChatHistoryService(db)
-    session = service.get_user_session(current_user.id, session_id)
+    session = await service.get_user_session(current_user.id, session_id)
     
     if not session:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
     
-    return session
+    page = await _message_page(service, session_id, limit, None)
+    return ChatSessionResponse(
+        id=session.id,
+        title=session.title,
+        created_at=session.created_at,
+        updated_at=session.updated_at,
+        messages=page.items,
+        next_cursor=page.next_cursor
+    )
+
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessagePage)
+async def get_chat_session_messages(
+    session_id: int,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Mensajes de una sesión por páginas, de los más recientes hacia atrás (cada página en orden cronológico)"""
+    service = ChatHistoryService(db)
+    if not await service.get_user_session(current_user.id, session_id):
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    
+    return await _message_page(service, session_id, limit, cursor)
 
 @router.post("/sessions", response_model=ChatSessionResponse)
 async def create_chat_session(
     session_data: ChatSessionCreate, 
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crear una nueva sesión de chat"""
     service = ChatHistoryService(db)
-    session = service.create_session(session_data.title, current_user.id)
-    return session
+    session = await service.create_session(session_data.title, current_user.id)
+    # Sesión recién creada: sin mensajes (la relación no se carga de forma perezosa en async)
+    return ChatSessionResponse(
+        id=session.id,
+        title=session.title,
+        created_at=session.created_at,
+        updated_at=session.updated_at
+    )
 
 @router.delete("/sessions/{session_id}")
 async def delete_chat_session(
     session_id: int, 
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Eliminar una sesión de chat"""
     service = ChatHistoryService(db)
-    success = service.delete_user_session(current_user.id, session_id)
+    success = await service.delete_user_session(current_user.id, session_id)
     
     if not success:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
@@ -93,11 +137,11 @@ async def update_session_title(
     session_id: int, 
     title_data: dict, 
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualizar el título de una sesión"""
     service = ChatHistoryService(db)
-    success = service.update_user_session_title(current_user.id, session_id, title_data["title"])
+    success = await service.update_user_session_title(current_user.id, session_id, title_data["title"])
     
     if not success:
         raise HTTPException(status_code=404, detail="Sesión no encontrada")
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import get_db, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, User
 from app.services.auth import UserService
 from app.models.auth import UserSettingsUpdate, UserSettingsResponse
 from app.core.deps import get_current_active_user
@@ -10,15 +10,15 @@ router = APIRouter(prefix="/settings", tags=["User Settings"])
 @router.get("", response_model=UserSettingsResponse)
 async def get_user_settings(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener configuración del usuario"""
     user_service = UserService(db)
-    settings = user_service.get_user_settings(current_user.id)
+    settings = await user_service.get_user_settings(current_user.id)
     
     if not settings:
         # Crear configuración por defecto si no existe
-        settings = user_service.create_default_settings(current_user.id)
+        settings = await user_service.create_default_settings(current_user.id)
     
     return settings
 
@@ -26,19 +26,19 @@ async def get_user_settings(
 async def update_user_settings(
     settings_update: UserSettingsUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualizar configuración del usuario"""
     user_service = UserService(db)
     
     # Obtener configuración existente o crear una nueva
-    settings = user_service.get_user_settings(current_user.id)
+    settings = await user_service.get_user_settings(current_user.id)
     if not settings:
         # Crear configuración por defecto si no existe
-        settings = user_service.create_default_settings(current_user.id)
+        settings = await user_service.create_default_settings(current_user.id)
     
     # Actualizar configuración
-    updated_settings = user_service.update_user_settings(current_user.id, settings_update)
+    updated_settings = await user_service.update_user_settings(current_user.id, settings_update)
     
     if not updated_settings:
         raise HTTPException(
@@ -51,11 +51,11 @@ async def update_user_settings(
 @router.post("/test-openai")
 async def test_openai_key(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Probar la clave API de OpenAI"""
     user_service = UserService(db)
-    settings = user_service.get_user_settings(current_user.id)
+    settings = await user_service.get_user_settings(current_user.id)
     
     if not settings or not settings.openai_api_key:
         raise HTTPException(
@@ -81,11 +81,11 @@ async def test_openai_key(
 @router.post("/test-mongodb")
 async def test_mongodb_connection(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Probar la conexión a MongoDB"""
     user_service = UserService(db)
-    settings = user_service.get_user_settings(current_user.id)
+    settings = await user_service.get_user_settings(current_user.id)
     
     if not settings or not settings.mongo_uri:
         raise HTTPException(
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """Caché en memoria acotada por tamaño (LRU) y, opcionalmente, por tiempo de vida.
+
+    Es segura entre hilos y lleva contadores de aciertos, fallos y desalojos.
+    ``on_evict`` se llama (fuera del lock) con cada par clave/valor desalojado,
+    útil para cerrar recursos como clientes HTTP o de base de datos.
+    """
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize debe ser mayor que 0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, expires_at: Optional[float], now: float) -> bool:
+        return expires_at is not None and expires_at <= now
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        evicted = None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self._expired(item[1], time.monotonic()):
+                evicted = (key, self._data.pop(key)[0])
+                self.evictions += 1
+                item = None
+            if item is None:
+                self.misses += 1
+            else:
+                # Orden LRU = orden de último acceso
+                self._data[key] = (item[0], item[1], time.monotonic())
+                self._data.move_to_end(key)
+                self.hits += 1
+        if evicted:
+            self._notify([evicted])
+        return default if item is None else item[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            expires_at = now + self.ttl if self.ttl else None
+            if key in self._data:
+                old = self._data.pop(key)[0]
+                if old is not value:
+                    evicted.append((key, old))
+            self._data[key] = (value, expires_at, now)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._pop_oldest())
+        self._notify(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Quita la entrada sin llamar a ``on_evict`` (el llamador se queda con el valor)."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def expire(self, idle: Optional[float] = None) -> int:
+        """Desaloja entradas caducadas y, si se indica, las no usadas en ``idle`` segundos."""
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            for key, (value, expires_at, touched_at) in list(self._data.items()):
+                if self._expired(expires_at, now) or (idle is not None and touched_at <= now - idle):
+                    evicted.append((key, self._data.pop(key)[0]))
+            self.evictions += len(evicted)
+        self._notify(evicted)
+        return len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = [(key, item[0]) for key, item in self._data.items()]
+            self._data.clear()
+        self._notify(evicted)
+
+    def _pop_oldest(self) -> tuple:
+        key, item = self._data.popitem(last=False)
+        self.evictions += 1
+        return key, item[0]
+
+    def _notify(self, evicted) -> None:
+        if self._on_evict:
+            for key, value in evicted:
+                self._on_evict(key, value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._expired(item[1], time.monotonic())
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import SecretStr
 from dotenv import load_dotenv
@@ -9,22 +10,99 @@ from pathlib import Path
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+# Dimensión nativa de cada modelo de embeddings
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
 class Settings(BaseSettings):
     OPENAI_API_KEY: SecretStr
     mongo_uri: str = "mongodb://localhost:27017/"
     mongo_db: str = "BaseConocimiento"
     mongo_collection: str = "Viaje"
+    # Campo con la fecha de modificación de cada chunk (p.e. "updated_at"): con él la versión del corpus
+    # detecta ediciones además de altas y bajas. Requiere un índice sobre el campo (si no lo hay se ignora
+    # avisando); vacío = sólo altas y bajas
+    mongo_version_field: str = ""
+    # Un MongoClient por URI distinta: máximo de clientes vivos, tamaño de cada pool y cierre por inactividad (s)
+    mongo_max_clients: int = 16
+    mongo_max_pool_size: int = 20
+    mongo_client_idle_timeout: float = 300.0
     embedding_model_name: str = "text-embedding-3-small"
+    # 0 = dimensión nativa del modelo; otro valor se pide reducido a la API (sólo text-embedding-3) y los
+    # vectores del corpus guardados con más dimensiones se truncan y renormalizan al construir el índice
+    embedding_dimension: int = 0
+    # Caché LRU de embeddings de consultas (0 = desactivada); ttl en segundos (0 = sin caducidad)
+    embedding_cache_size: int = 2048
+    embedding_cache_ttl: float = 3600.0
+    # Caché de embeddings en disco (SQLite) compartida entre workers; vacío = desactivada
+    embedding_disk_cache_path: Optional[str] = None
+    embedding_disk_cache_max_entries: int = 100_000
+    # Micro‑batching: consultas que llegan dentro de la ventana van en una sola llamada (0 = desactivado)
+    embedding_batch_window_ms: float = 5.0
+    embedding_batch_max_size: int = 32
+    # Caché de respuestas por prompt exacto (0 = desactivada); sólo con temperatura <= answer_cache_max_temperature
+    answer_cache_size: int = 512
+    answer_cache_ttl: float = 3600.0
+    answer_cache_max_temperature: float = 0.0
+    # Caché semántica: reutiliza la respuesta de una pregunta parecida (coseno >= umbral) con los mismos chunks
+    semantic_cache_size: int = 1024
+    semantic_cache_threshold: float = 0.95
     llm_model_name: str = "gpt-4o-mini"
+    # Tope de tokens del prompt (además de la ventana del modelo); 0 = sólo la ventana
+    prompt_max_tokens: int = 8000
+    # Historial en el prompt: últimos mensajes literales + resumen acumulado del resto (en segundo plano);
+    # 10 como antes de los resúmenes, así desactivarlos no recorta la ventana
+    history_recent_messages: int = 10
+    history_summary_enabled: bool = True
+    history_summary_max_words: int = 200
     llm_temperature: float = 0.0
+    # Máximo de clientes ChatOpenAI reutilizables (uno por API key/modelo/temperatura/max_tokens)
+    llm_client_pool_size: int = 32
+    # Máximo de orígenes de chunks (MongoDB por usuario) con servicio e índice en memoria
+    max_tenant_services: int = 32
+    # SQLite del historial: pragmas aplicados a cada conexión
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kb: int = 64 * 1024
+    # Cada cuántos segundos se comprueba si cambió la versión del corpus para renovar el índice
+    # (un repositorio sin versión se reconstruye en cada intervalo); 0 = nunca
+    index_refresh_seconds: float = 300.0
+    # Directorio de snapshots vectoriales (ver export_snapshot.py); vacío = construir desde Mongo
+    vector_snapshot_dir: Optional[str] = None
+    # Índice de recuperación: "exact" (fuerza bruta) o "ivf" (aproximado)
+    index_type: str = "exact"
+    ivf_n_lists: int = 0  # 0 = sqrt(N)
+    ivf_n_probe: int = 8
+    # Almacenamiento del índice: "float32", "float16" o "int8". Cada bloque se convierte a float32 al puntuar
+    # (benchmark_retrieval.py, 100k x 256): float16 = 2x menos memoria pero ~5x más lento que float32 (72 ms
+    # frente a 13 ms por consulta), sólo compensa si la memoria es el límite; int8 = 4x menos memoria con
+    # latencia similar y recall@10 ~0.97. Para 8-16x, int8 con index_dim (p.e. 1536 -> 384 dimensiones).
+    # rescore = k * N candidatos re‑puntuados en float32 con todas las dimensiones: desde el snapshot mapeado
+    # (vector_snapshot_dir) o, si sólo se trunca con index_dim, desde una copia completa en memoria (la matriz
+    # float32 entera más la truncada); con el índice cuantizado construido en memoria se ignora avisando
+    index_dtype: str = "float32"
+    index_rescore: int = 0
+    # Truncado Matryoshka (text-embedding-3): dimensiones usadas en la primera pasada; 0 = todas
+    index_dim: int = 0
 
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
-        "case_sensitive": True,
+        # ANSWER_CACHE_SIZE y answer_cache_size configuran el mismo campo (el README documenta las mayúsculas)
+        "case_sensitive": False,
         "extra": "ignore"
     }
 
+    @property
+    def embedding_dim(self) -> int:
+        """Dimensión de los vectores del corpus para el modelo configurado."""
+        return self.embedding_dimension or EMBEDDING_DIMENSIONS.get(self.embedding_model_name, 1536)
+
 @lru_cache
 def get_settings() -> Settings:
     return Settings()
@@ -0,0 +1,76 @@
+import threading
+from typing import Optional
+from fastapi import Request
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+from app.repositories.factory import create_chunk_repository
+from app.repositories.mongo_clients import create_mongo_registry
+from app.services.chat import ChatService
+from app.services.embedding import EmbeddingService
+from app.services.llm import LLMService
+from app.services.summary import ConversationSummarizer
+
+class ServiceContainer:
+    """Servicios pesados creados una sola vez por aplicación (ver ``lifespan`` en main.py).
+
+    Embeddings y LLM se comparten entre todas las peticiones. Cada origen de
+    datos distinto (la colección por defecto o el MongoDB propio de un usuario)
+    tiene su propio ChatService, con su repositorio e índice vectorial, en un
+    LRU acotado. Los clientes de MongoDB viven en un registro propio del
+    contenedor (ver ``mongo_clients``), compartido por todos sus repositorios
+    y cerrado junto con él sin afectar a otros contenedores.
+    """
+    def __init__(self, max_tenants: Optional[int] = None) -> None:
+        self.embeddings = EmbeddingService()
+        self.llm = LLMService()
+        self.mongo = create_mongo_registry()
+        cfg = get_settings()
+        self.summarizer = ConversationSummarizer(
+            self.llm,
+            recent=cfg.history_recent_messages,
+            max_words=cfg.history_summary_max_words,
+            max_prompt_tokens=cfg.prompt_max_tokens,
+        )
+        self._services = LRUCache(
+            max_tenants or get_settings().max_tenant_services,
+            on_evict=lambda key, service: service.close(),
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tenant_key(user_settings: Optional[dict] = None) -> tuple:
+        """Identifica el origen de los chunks; sin MongoDB propio todos comparten el por defecto."""
+        if not user_settings or not user_settings.get("mongodb_url"):
+            return ()
+        return (
+            user_settings.get("mongodb_url"),
+            user_settings.get("mongodb_db_name"),
+            user_settings.get("mongodb_collection_name"),
+        )
+
+    def chat_service(self, user_settings: Optional[dict] = None) -> ChatService:
+        key = self.tenant_key(user_settings)
+        service = self._services.get(key)
+        if service is None:
+            # Bajo lock para no crear (y cerrar) dos servicios para el mismo origen
+            with self._lock:
+                service = self._services.get(key)
+                if service is None:
+                    repo = create_chunk_repository(user_settings, clients=self.mongo)
+                    service = ChatService(repo, self.embeddings, self.llm)
+                    self._services.set(key, service)
+        return service
+
+    def close(self) -> None:
+        self._services.clear()
+        self.embeddings.close()
+        self.mongo.close()
+
+    async def aclose(self) -> None:
+        """Como ``close`` esperando además el cierre de los clientes MongoDB asíncronos."""
+        self.close()
+        await self.mongo.aclose()
+
+def get_container(request: Request) -> ServiceContainer:
+    """Dependencia FastAPI: contenedor creado en el arranque de la aplicación."""
+    return request.app.state.container
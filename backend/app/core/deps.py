@@ -1,7 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, User
 from app.core.security import verify_token, credentials_exception
 from app.services.auth import UserService
 from typing import Optional
@@ -9,9 +9,9 @@ from typing import Optional
 # Configurar el esquema de autenticación
 security = HTTPBearer()
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Obtener usuario actual desde el token"""
     token = credentials.credentials
@@ -21,7 +21,7 @@ def get_current_user(
         raise credentials_exception
     
     user_service = UserService(db)
-    user = user_service.get_user_by_email(email)
+    user = await user_service.get_user_by_email(email)
     
     if user is None:
         raise credentials_exception
@@ -44,9 +44,9 @@ def get_current_superuser(current_user: User = Depends(get_current_user)) -> Use
     return current_user
 
 # Dependencia opcional para obtener usuario si existe
-def get_current_user_optional(
+async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Optional[User]:
     """Obtener usuario actual opcional (puede ser None)"""
     if not credentials:
@@ -59,6 +59,6 @@ def get_current_user_optional(
         return None
     
     user_service = UserService(db)
-    user = user_service.get_user_by_email(email)
+    user = await user_service.get_user_by_email(email)
     
     return user
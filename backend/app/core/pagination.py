@@ -0,0 +1,22 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+# Posición de keyset: (marca de tiempo de ordenación, id de desempate)
+Position = Tuple[datetime, int]
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Cursor opaco para la posición ``(timestamp, row_id)`` de una página."""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Position]:
+    """Inverso de ``encode_cursor``; lanza ValueError si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
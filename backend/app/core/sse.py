@@ -0,0 +1,9 @@
+import json
+from typing import Any
+
+# Cabeceras para que proxies (p.e. nginx) no acumulen el stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def format_sse(event: str, data: Any) -> str:
+    """Serializa un evento Server‑Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
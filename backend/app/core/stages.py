@@ -0,0 +1,51 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple
+
+StageFunc = Callable[..., Awaitable[Any]]
+
+class StageGraph:
+    """Grafo explícito de etapas asíncronas de una petición.
+
+    Cada etapa declara de qué etapas depende (``after``) y recibe sus
+    resultados como argumentos con el mismo nombre. Las etapas sin
+    dependencias pendientes corren a la vez, de modo que la latencia total es
+    la del camino crítico. Si una etapa falla se cancelan las demás y se
+    propaga su excepción. ``timings`` guarda la duración de cada etapa (ms).
+    """
+    def __init__(self) -> None:
+        self._stages: Dict[str, Tuple[StageFunc, Tuple[str, ...]]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, func: StageFunc, after: Sequence[str] = ()) -> "StageGraph":
+        if name in self._stages:
+            raise ValueError(f"Etapa duplicada: {name}")
+        missing = [dep for dep in after if dep not in self._stages]
+        if missing:
+            # Exigir dependencias ya declaradas impide ciclos por construcción
+            raise ValueError(f"La etapa {name} depende de etapas no declaradas: {missing}")
+        self._stages[name] = (func, tuple(after))
+        return self
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]) -> Any:
+        func, after = self._stages[name]
+        kwargs = {dep: await tasks[dep] for dep in after}
+        start = time.perf_counter()
+        try:
+            return await func(**kwargs)
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    async def run(self) -> Dict[str, Any]:
+        """Ejecuta el grafo y devuelve el resultado de cada etapa por nombre."""
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(self._run_stage(name, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
@@ -1,11 +1,20 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import os
+from app.core.config import get_settings
 
 Base = declarative_base()
 
+# Longitud de la vista previa del último mensaje del usuario en el listado de sesiones
+PREVIEW_LENGTH = 100
+
+def message_preview(content: str) -> str:
+    """Vista previa de un mensaje para el listado de sesiones."""
+    return content[:PREVIEW_LENGTH] + ("..." if len(content) > PREVIEW_LENGTH else "")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -63,6 +72,10 @@ class UserSettings(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    # Listado de sesiones de un usuario por fecha de actualización
+    __table_args__ = (
+        Index("ix_chat_sessions_user_updated_at", "user_id", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Permitir null para compatibilidad
@@ -70,14 +83,31 @@ class ChatSession(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relación con mensajes
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    # Resumen acumulado de los mensajes antiguos y último mensaje incluido en él
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
+    
+    # Contadores desnormalizados para el listado (los mantiene ChatHistoryService.add_message)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_user_preview = Column(String(PREVIEW_LENGTH + 3), nullable=True)
+    
+    # Relación con mensajes (en orden cronológico, servido por el índice compuesto)
+    messages = relationship(
+        "ChatMessage",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="[ChatMessage.created_at, ChatMessage.id]",
+    )
     
     # Relación con usuario
     user = relationship("User", back_populates="chat_sessions")
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # Lecturas por sesión en orden (últimos N, desde un id): el rowid completa la clave en SQLite
+    __table_args__ = (
+        Index("ix_chat_messages_session_created_at", "session_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
@@ -88,13 +118,113 @@ class ChatMessage(Base):
     # Relación con sesión
     session = relationship("ChatSession", back_populates="messages")
 
-# Configuración de la base de datos
+# Configuración de la base de datos: el engine síncrono sólo crea y migra el esquema al
+# arrancar; las peticiones usan el asíncrono (aiosqlite) para no bloquear el event loop
 DATABASE_URL = "sqlite:///./chat_history.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./chat_history.db"
+
+def apply_sqlite_pragmas(dbapi_connection, settings=None) -> None:
+    """Ajustes de SQLite por conexión para escrituras concurrentes.
+
+    WAL deja leer mientras otro escribe y, con ``synchronous=NORMAL``, sólo
+    sincroniza a disco en los checkpoints; ``busy_timeout`` hace que un
+    escritor espere al lock en lugar de fallar con "database is locked".
+    """
+    settings = settings or get_settings()
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        # Negativo = tamaño en KiB en lugar de páginas
+        cursor.execute(f"PRAGMA cache_size={-int(settings.sqlite_cache_size_kb)}")
+    finally:
+        cursor.close()
+
+def create_sqlite_engine(url: str = DATABASE_URL, settings=None):
+    """Engine de SQLite con los pragmas aplicados en cada conexión nueva del pool."""
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, settings)
+
+    return engine
+
+def create_async_sqlite_engine(url: str = ASYNC_DATABASE_URL, settings=None):
+    """Engine asíncrono de SQLite (aiosqlite) con los mismos pragmas por conexión."""
+    async_engine = create_async_engine(url)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, settings)
+
+    return async_engine
+
+def create_async_session_factory(async_engine) -> async_sessionmaker:
+    # expire_on_commit=False: los objetos siguen legibles tras el commit sin lazy loads
+    # (que en una sesión asíncrona no están permitidos)
+    return async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+engine = create_sqlite_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_sqlite_engine()
+AsyncSessionLocal = create_async_session_factory(async_engine)
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
+
+# Columnas derivadas que deben calcularse al añadirse a una base con datos: (tabla origen, UPDATE)
+_BACKFILLS = {
+    ("chat_sessions", "message_count"): (
+        "chat_messages",
+        "UPDATE chat_sessions SET message_count = "
+        "(SELECT COUNT(*) FROM chat_messages WHERE chat_messages.session_id = chat_sessions.id)",
+    ),
+    ("chat_sessions", "last_user_preview"): (
+        "chat_messages",
+        "UPDATE chat_sessions SET last_user_preview = ("
+        f"SELECT CASE WHEN length(content) > {PREVIEW_LENGTH} "
+        f"THEN substr(content, 1, {PREVIEW_LENGTH}) || '...' ELSE content END "
+        "FROM chat_messages WHERE chat_messages.session_id = chat_sessions.id AND role = 'user' "
+        "ORDER BY created_at DESC, id DESC LIMIT 1)",
+    ),
+}
+
+def migrate_schema(bind=None):
+    """Migración ligera para bases existentes: create_all no modifica tablas ya creadas.
+
+    Añade las columnas nuevas del modelo que falten (siempre nullable o con
+    default de servidor), las rellena a partir de los datos existentes
+    cuando hace falta (``_BACKFILLS``) y crea los índices que no existan.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    added = set()
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" DEFAULT {default.text}" if hasattr(default, "text") else f" DEFAULT '{default}'"
+                conn.execute(text(ddl))
+                added.add((table.name, column.name))
+        for key, (source, statement) in _BACKFILLS.items():
+            if key in added and inspector.has_table(source):
+                conn.execute(text(statement))
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
@@ -102,3 +232,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.chat import router as chat_router
@@ -5,7 +6,22 @@ from app.api.v1.chat_history import router as chat_history_router
 from app.api.v1.history import router as history_router
 from app.api.v1.auth import router as auth_router
 from app.api.v1.settings import router as settings_router
-from app.database import create_tables
+from app.core.config import get_settings
+from app.core.container import ServiceContainer
+from app.database import async_engine, create_tables
+from app.services.prompt_builder import aget_token_counter
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Servicios pesados (clientes de MongoDB y OpenAI, índices) una vez por proceso
+    app.state.container = ServiceContainer()
+    # tiktoken puede descargar la codificación: mejor al arrancar que en la primera petición
+    await aget_token_counter(get_settings().llm_model_name)
+    try:
+        yield
+    finally:
+        await app.state.container.aclose()
+        await async_engine.dispose()
 
 def create_app() -> FastAPI:
     # Crear las tablas de la base de datos
@@ -15,6 +31,7 @@ def create_app() -> FastAPI:
         title="Knowledge‑Base Chat API",
         version="0.1.0",
         description="Chatbot con contexto multimedia almacenado en MongoDB y embeddings OpenAI.",
+        lifespan=lifespan,
     )
     
     # Configurar CORS
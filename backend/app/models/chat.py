@@ -9,3 +9,5 @@ class ChatAnswer(BaseModel):
     images: List[str] = []
     videos: List[str] = []
     session_id: Optional[int] = None
+    # Tokens del prompt enviado al LLM (ver PromptBuilder)
+    prompt_tokens: Optional[int] = None
@@ -6,4 +6,5 @@ class Chunk(BaseModel):
     texto: str
     imagenes: List[str] = []
     videos: List[str] = []
-    vector: List[float] = Field(default_factory=list, min_length=1536, max_length=1536)
+    # La dimensión depende del modelo de embeddings (ver Settings.embedding_dim)
+    vector: List[float] = Field(default_factory=list)
@@ -24,6 +24,8 @@ class ChatSessionResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     messages: List[ChatMessageResponse] = []
+    # Cursor para pedir los mensajes anteriores a ``messages`` (None si no hay más)
+    next_cursor: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -35,3 +37,12 @@ class ChatHistoryResponse(BaseModel):
     updated_at: datetime
     message_count: int
     last_message_preview: Optional[str] = None
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistoryResponse]
+    next_cursor: Optional[str] = None
+
+class ChatMessagePage(BaseModel):
+    # Mensajes en orden cronológico; ``next_cursor`` apunta a la página anterior (más antigua)
+    items: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None
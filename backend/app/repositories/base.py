@@ -1,9 +1,47 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Iterable
+from typing import Iterable, List, Optional, Sequence, Tuple
 from app.models.chunk import Chunk
+from app.services.vector_index import VectorIndex
 
 class IChunkRepository(ABC):
     """Interface Segregation: sólo expone lo que el servicio necesita."""
     @abstractmethod
     def get_all(self) -> Iterable[Chunk]:
         raise NotImplementedError
+
+    @property
+    def version(self) -> Optional[str]:
+        """Versión del corpus si el repositorio la conoce (p.e. un snapshot en disco)."""
+        return None
+
+    def get_vectors(self) -> Iterable[Tuple[str, List[float]]]:
+        """Pares (id, vector) de los chunks con texto, sin cargar texto ni multimedia.
+
+        La implementación por defecto recorre ``get_all``; los repositorios
+        concretos deberían sobrescribirla con una proyección más barata.
+        """
+        for position, chunk in enumerate(self.get_all()):
+            if chunk.texto:
+                yield chunk.id or str(position), chunk.vector
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        """Chunks completos para los ids indicados, en el mismo orden."""
+        wanted = set(ids)
+        found = {}
+        for position, chunk in enumerate(self.get_all()):
+            key = chunk.id or str(position)
+            if key in wanted:
+                found[key] = chunk
+        return [found[i] for i in ids if i in found]
+
+    async def aget_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        """Versión asíncrona de ``get_by_ids``; por defecto la ejecuta en un hilo aparte."""
+        return await asyncio.to_thread(self.get_by_ids, ids)
+
+    def load_index(self, dim: Optional[int] = None) -> VectorIndex:
+        """Índice vectorial del corpus; un repositorio puede servirlo sin recalcularlo (p.e. desde disco)."""
+        return VectorIndex.from_vectors(self.get_vectors(), dim=dim)
+
+    def close(self) -> None:
+        """Libera conexiones u otros recursos del repositorio."""
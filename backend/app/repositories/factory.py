@@ -0,0 +1,23 @@
+from typing import Optional
+from app.core.config import get_settings
+from .base import IChunkRepository
+from .mongo_chunk import MongoChunkRepository
+from .mongo_clients import MongoClientRegistry
+from .vector_snapshot import SnapshotChunkRepository
+
+def create_chunk_repository(
+    user_settings: Optional[dict] = None,
+    clients: Optional[MongoClientRegistry] = None,
+) -> IChunkRepository:
+    """Repositorio de chunks para la configuración dada.
+
+    El snapshot en disco sólo describe la colección por defecto, así que los
+    usuarios con su propio MongoDB siguen construyendo el índice desde Mongo.
+    ``clients`` es el registro de clientes MongoDB a usar (por defecto el del proceso).
+    """
+    cfg = get_settings()
+    repo = MongoChunkRepository(user_settings, clients=clients)
+    uses_own_mongo = bool(user_settings and user_settings.get("mongodb_url"))
+    if cfg.vector_snapshot_dir and not uses_own_mongo:
+        return SnapshotChunkRepository(repo, cfg.vector_snapshot_dir)
+    return repo
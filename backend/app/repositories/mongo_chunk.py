@@ -1,13 +1,20 @@
-from typing import Iterable, Optional
-from pymongo import MongoClient
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Sequence, Tuple
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
 from bson import ObjectId
 from app.core.config import get_settings
 from app.models.chunk import Chunk
 from .base import IChunkRepository
+from .mongo_clients import MongoClientRegistry, get_mongo_registry
 
 class MongoChunkRepository(IChunkRepository):
     """Implementación que cumple Liskov: se puede sustituir por otra fuente (p.e. Postgres)."""
-    def __init__(self, user_settings: Optional[dict] = None) -> None:
+    def __init__(
+        self,
+        user_settings: Optional[dict] = None,
+        clients: Optional[MongoClientRegistry] = None,
+    ) -> None:
         cfg = get_settings()
         
         # Usar configuración del usuario si está disponible
@@ -20,20 +27,120 @@ class MongoChunkRepository(IChunkRepository):
             mongo_db = cfg.mongo_db
             mongo_collection = cfg.mongo_collection
         
-        self._collection = (
-            MongoClient(mongo_uri)
-            [mongo_db]
-            [mongo_collection]
+        # El cliente lo gestiona el registro compartido (uno por URI), no el repositorio
+        self._clients = clients or get_mongo_registry()
+        self._uri = mongo_uri
+        self._db = mongo_db
+        self._collection_name = mongo_collection
+        self._version_field = cfg.mongo_version_field
+        self._version_field_checked = False
+
+    @contextmanager
+    def _collection(self) -> Iterator[Collection]:
+        with self._clients.client(self._uri) as client:
+            yield client[self._db][self._collection_name]
+
+    @asynccontextmanager
+    async def _acollection(self) -> AsyncIterator[AsyncCollection]:
+        async with self._clients.aclient(self._uri) as client:
+            yield client[self._db][self._collection_name]
+
+    @property
+    def version(self) -> str:
+        """Huella del estado de la colección: nº de documentos, último ``_id`` y última modificación.
+
+        Son lecturas baratas (metadatos e índices) que detectan altas y bajas y,
+        si los chunks guardan ``mongo_version_field``, también ediciones.
+        ChatService la consulta como mucho cada ``index_refresh_seconds``.
+        """
+        with self._collection() as collection:
+            parts = [collection.estimated_document_count()]
+            last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            parts.append(last["_id"] if last else None)
+            if self._version_field and not self._version_field_checked:
+                self._check_version_index(collection)
+            if self._version_field:
+                newest = collection.find_one(
+                    {self._version_field: {"$exists": True}},
+                    {self._version_field: 1},
+                    sort=[(self._version_field, -1)],
+                )
+                parts.append(newest[self._version_field] if newest else None)
+        return ":".join(str(part) for part in parts)
+
+    def _check_version_index(self, collection: Collection) -> None:
+        """Sin índice sobre ``mongo_version_field`` ordenar por él recorrería toda la colección: se ignora avisando."""
+        self._version_field_checked = True
+        indexed = any(
+            next(iter(info["key"]))[0] == self._version_field
+            for info in collection.index_information().values()
         )
-    
+        if not indexed:
+            print(
+                f"mongo_version_field '{self._version_field}' ignorado: {self._db}.{self._collection_name} "
+                "no tiene un índice sobre ese campo"
+            )
+            self._version_field = ""
+
     def _convert_object_ids(self, doc: dict) -> dict:
         """Convierte ObjectId a string para compatibilidad con Pydantic."""
         if "_id" in doc and isinstance(doc["_id"], ObjectId):
             doc["_id"] = str(doc["_id"])
         return doc
 
+    @staticmethod
+    def _id_filter(ids: Sequence[str]) -> dict:
+        """Filtro ``$in`` que acepta ids guardados como ObjectId o como string."""
+        keys: list = []
+        for chunk_id in ids:
+            keys.append(chunk_id)
+            if ObjectId.is_valid(chunk_id):
+                keys.append(ObjectId(chunk_id))
+        return {"_id": {"$in": keys}}
+
     def get_all(self) -> Iterable[Chunk]:
-        for doc in self._collection.find():
-            # Convertir ObjectId a string para compatibilidad con Pydantic
-            doc = self._convert_object_ids(doc)
-            yield Chunk(**doc)
+        with self._collection() as collection:
+            for doc in collection.find():
+                # Convertir ObjectId a string para compatibilidad con Pydantic
+                doc = self._convert_object_ids(doc)
+                yield Chunk(**doc)
+
+    def get_vectors(self) -> Iterable[Tuple[str, List[float]]]:
+        # Proyección sólo del vector: no viajan texto ni multimedia
+        with self._collection() as collection:
+            cursor = collection.find(
+                {"texto": {"$nin": [None, ""]}},
+                {"vector": 1},
+            )
+            for doc in cursor:
+                yield str(doc["_id"]), doc.get("vector") or []
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        if not ids:
+            return []
+        # Una sola consulta $in para los ganadores, sin el vector
+        found = {}
+        with self._collection() as collection:
+            cursor = collection.find(
+                self._id_filter(ids),
+                {"texto": 1, "imagenes": 1, "videos": 1},
+            )
+            for doc in cursor:
+                doc = self._convert_object_ids(doc)
+                found[doc["_id"]] = Chunk(**doc)
+        return [found[i] for i in ids if i in found]
+
+    async def aget_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        if not ids:
+            return []
+        # Misma consulta que get_by_ids con el driver asíncrono: no bloquea el event loop
+        found = {}
+        async with self._acollection() as collection:
+            cursor = collection.find(
+                self._id_filter(ids),
+                {"texto": 1, "imagenes": 1, "videos": 1},
+            )
+            async for doc in cursor:
+                doc = self._convert_object_ids(doc)
+                found[doc["_id"]] = Chunk(**doc)
+        return [found[i] for i in ids if i in found]
@@ -0,0 +1,211 @@
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Dict, Iterator, Set, Union
+from pymongo import AsyncMongoClient, MongoClient
+from app.core.cache import LRUCache
+from app.core.config import get_settings
+
+AnyClient = Union[MongoClient, AsyncMongoClient]
+
+class MongoClientRegistry:
+    """Un único ``MongoClient`` por URI distinta, compartido por todos los repositorios.
+
+    Cada cliente mantiene su pool de sockets y sus hilos de monitorización, por
+    lo que abrir uno por petición agota descriptores. El registro acota el pool
+    de cada cliente (``max_pool_size``), cuántos clientes hay vivos
+    (``max_clients``, LRU) y cierra los que llevan ``idle_timeout`` segundos sin
+    usarse. Un cliente desalojado mientras alguna operación lo usa se cierra
+    cuando la última lo suelta.
+
+    ``aclient`` hace lo mismo con ``AsyncMongoClient`` (driver asíncrono
+    nativo de pymongo). Un cliente asíncrono queda ligado al event loop donde
+    se usa, así que la clave incluye también el loop y su cierre se espera en
+    ese loop aunque el desalojo ocurra en otro hilo.
+    """
+    # Cada cuántos segundos, como mucho, se buscan clientes inactivos
+    _sweep_interval = 30.0
+
+    def __init__(
+        self,
+        max_clients: int = 16,
+        max_pool_size: int = 20,
+        idle_timeout: float = 300.0,
+        server_selection_timeout_ms: int = 5000,
+    ) -> None:
+        self.max_pool_size = max_pool_size
+        self.idle_timeout = idle_timeout
+        self._server_selection_timeout_ms = server_selection_timeout_ms
+        self._clients = LRUCache(max_clients, on_evict=self._retire)
+        self._async_clients = LRUCache(max_clients, on_evict=self._retire)
+        # Reentrante: set() en el LRU puede desalojar y llamar a _retire con el lock tomado
+        self._lock = threading.RLock()
+        self._leases: Dict[int, int] = {}
+        self._retired: Dict[int, AnyClient] = {}
+        # Event loop dueño de cada cliente asíncrono (por id del cliente)
+        self._owners: Dict[int, asyncio.AbstractEventLoop] = {}
+        self._closing: Set[Union[asyncio.Task, concurrent.futures.Future]] = set()
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.closed = 0
+
+    def _options(self) -> dict:
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "maxIdleTimeMS": int(self.idle_timeout * 1000),
+            "serverSelectionTimeoutMS": self._server_selection_timeout_ms,
+        }
+
+    def _create(self, uri: str) -> MongoClient:
+        self.created += 1
+        return MongoClient(uri, **self._options())
+
+    def _create_async(self, uri: str) -> AsyncMongoClient:
+        self.created += 1
+        return AsyncMongoClient(uri, **self._options())
+
+    def _retire(self, key, client: "AnyClient") -> None:
+        """Callback de desalojo: cierra ya o cuando termine la última operación en curso."""
+        with self._lock:
+            if self._leases.get(id(client)):
+                self._retired[id(client)] = client
+                return
+        self._close(client)
+
+    def _close(self, client: "AnyClient") -> None:
+        owner = self._owners.pop(id(client), None)
+        result = client.close()
+        self.closed += 1
+        if inspect.isawaitable(result):
+            self._await_close(result, owner)
+
+    def _await_close(self, result: Awaitable, owner: asyncio.AbstractEventLoop) -> None:
+        """Espera ``AsyncMongoClient.close`` en el loop dueño del cliente.
+
+        El desalojo puede ocurrir en otro hilo (p.e. el barrido de inactivos
+        desde un repositorio síncrono en el threadpool): en ese caso el cierre
+        se envía al loop dueño con ``run_coroutine_threadsafe``.
+        """
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if owner is None or owner is current:
+            if current is None:
+                # Sin loop en marcha no se puede esperar el cierre; se descarta la corrutina
+                result.close()
+                return
+            closing = current.create_task(result)
+        elif owner.is_running():
+            closing = asyncio.run_coroutine_threadsafe(result, owner)
+        else:
+            # El loop dueño ya terminó: sus sockets se cerraron con él
+            result.close()
+            return
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        if self.idle_timeout and now - self._last_sweep >= self._sweep_interval:
+            self._last_sweep = now
+            self._clients.expire(idle=self.idle_timeout)
+            self._async_clients.expire(idle=self.idle_timeout)
+
+    def _acquire(self, clients: LRUCache, key, create) -> "AnyClient":
+        self._sweep()
+        with self._lock:
+            client = clients.get(key)
+            if client is None:
+                # Los clientes no conectan en el constructor: crearlos bajo el lock es barato
+                client = create()
+                clients.set(key, client)
+            self._leases[id(client)] = self._leases.get(id(client), 0) + 1
+        return client
+
+    def _release(self, client: "AnyClient") -> None:
+        retired = None
+        with self._lock:
+            remaining = self._leases[id(client)] - 1
+            if remaining:
+                self._leases[id(client)] = remaining
+            else:
+                del self._leases[id(client)]
+                retired = self._retired.pop(id(client), None)
+        if retired is not None:
+            self._close(retired)
+
+    @contextmanager
+    def client(self, uri: str) -> Iterator[MongoClient]:
+        """Presta el cliente de ``uri`` mientras dura el bloque ``with``."""
+        client = self._acquire(self._clients, uri, lambda: self._create(uri))
+        try:
+            yield client
+        finally:
+            self._release(client)
+
+    @asynccontextmanager
+    async def aclient(self, uri: str) -> AsyncIterator[AsyncMongoClient]:
+        """Versión asíncrona de ``client`` para el event loop en curso."""
+        loop = asyncio.get_running_loop()
+
+        def create() -> AsyncMongoClient:
+            client = self._create_async(uri)
+            self._owners[id(client)] = loop
+            return client
+
+        client = self._acquire(self._async_clients, (uri, id(loop)), create)
+        try:
+            yield client
+        finally:
+            self._release(client)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_use = sum(self._leases.values())
+            retiring = len(self._retired)
+        return {
+            **self._clients.stats,
+            "async_clients": len(self._async_clients),
+            "created": self.created,
+            "closed": self.closed,
+            "in_use": in_use,
+            "retiring": retiring,
+            "max_pool_size": self.max_pool_size,
+        }
+
+    def close(self) -> None:
+        self._clients.clear()
+        self._async_clients.clear()
+
+    async def aclose(self) -> None:
+        """Como ``close`` pero espera a que terminen los cierres de clientes asíncronos."""
+        self.close()
+        current = asyncio.get_running_loop()
+        pending = [
+            asyncio.wrap_future(closing) if isinstance(closing, concurrent.futures.Future) else closing
+            for closing in list(self._closing)
+            # Las tareas de otro loop no se pueden esperar desde este
+            if isinstance(closing, concurrent.futures.Future) or closing.get_loop() is current
+        ]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+def create_mongo_registry() -> MongoClientRegistry:
+    """Registro nuevo con los límites de la configuración; quien lo crea es quien lo cierra."""
+    cfg = get_settings()
+    return MongoClientRegistry(
+        max_clients=cfg.mongo_max_clients,
+        max_pool_size=cfg.mongo_max_pool_size,
+        idle_timeout=cfg.mongo_client_idle_timeout,
+    )
+
+@lru_cache
+def get_mongo_registry() -> MongoClientRegistry:
+    """Registro compartido por los repositorios creados fuera de la aplicación (scripts, pruebas)."""
+    return create_mongo_registry()
@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from app.models.chunk import Chunk
+from app.services.vector_index import VectorIndex, normalize_rows
+from .base import IChunkRepository
+
+# Versión del formato en disco; se incrementa si cambia la estructura de archivos
+SNAPSHOT_FORMAT = 1
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+META_FILE = "meta.json"
+
+class VectorSnapshot:
+    """Snapshot abierto en modo sólo lectura: ids y vectores mapeados en memoria (zero‑copy)."""
+    def __init__(self, path: Path) -> None:
+        meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Formato de snapshot no soportado: {meta.get('format')}")
+        self.path = path
+        self.meta = meta
+        self.ids = np.load(path / IDS_FILE, mmap_mode="r")
+        self.vectors = np.load(path / VECTORS_FILE, mmap_mode="r")
+        if self.vectors.shape != (meta["count"], meta["dim"]) or len(self.ids) != meta["count"]:
+            raise ValueError(f"Snapshot inconsistente en {path}")
+
+    @property
+    def version(self) -> str:
+        return self.meta["version"]
+
+    def index(self) -> VectorIndex:
+        # Los vectores se guardan ya normalizados: el índice usa el mmap directamente
+        return VectorIndex(self.ids, self.vectors, normalized=True)
+
+def export_snapshot(
+    items: Iterable[Tuple[str, List[float]]],
+    root: str,
+    dim: int,
+    model: Optional[str] = None,
+    batch_size: int = 4096,
+) -> VectorSnapshot:
+    """Exporta pares (id, vector) a un nuevo snapshot versionado y lo publica como actual.
+
+    Los vectores se escriben por lotes, normalizados y en float32, de modo que la
+    memoria usada no depende del tamaño del corpus. La publicación cambia el
+    puntero ``CURRENT`` de forma atómica; los workers que ya tienen abierto el
+    snapshot anterior siguen funcionando.
+    """
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    version = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    target = root_path / version
+    target.mkdir()
+
+    ids: List[str] = []
+    raw_path = target / "vectors.f32"
+    with open(raw_path, "wb") as raw:
+        batch: List[List[float]] = []
+
+        def flush() -> None:
+            if batch:
+                rows = normalize_rows(np.asarray(batch, dtype=np.float32))
+                raw.write(rows.astype(np.float32).tobytes())
+                batch.clear()
+
+        for chunk_id, vector in items:
+            # Como VectorIndex.from_vectors: los más largos se truncan (Matryoshka) y se renormalizan en flush
+            if not vector or len(vector) < dim:
+                continue
+            ids.append(chunk_id)
+            batch.append(vector[:dim])
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+    count = len(ids)
+    vectors = np.lib.format.open_memmap(target / VECTORS_FILE, mode="w+", dtype=np.float32, shape=(count, dim))
+    if count:
+        vectors[:] = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(count, dim))
+    vectors.flush()
+    del vectors
+    raw_path.unlink()
+
+    width = max((len(i) for i in ids), default=1)
+    np.save(target / IDS_FILE, np.array(ids, dtype=f"U{width}"))
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "dim": dim,
+        "count": count,
+        "model": model,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    (target / META_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+    # Publicación atómica del nuevo snapshot
+    pointer = root_path / f"{CURRENT_FILE}.{uuid.uuid4().hex}"
+    pointer.write_text(version, encoding="utf-8")
+    os.replace(pointer, root_path / CURRENT_FILE)
+    return VectorSnapshot(target)
+
+def current_version(root: str) -> str:
+    """Versión publicada en ``CURRENT``."""
+    return (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+
+def open_snapshot(root: str, version: Optional[str] = None) -> VectorSnapshot:
+    """Abre el snapshot indicado o, por defecto, el publicado en ``CURRENT``."""
+    if version is None:
+        version = current_version(root)
+    return VectorSnapshot(Path(root) / version)
+
+def prune_snapshots(root: str, keep: int = 2) -> List[str]:
+    """Elimina versiones antiguas conservando las ``keep`` más recientes y la actual."""
+    root_path = Path(root)
+    current = current_version(root)
+    versions = sorted(p.name for p in root_path.iterdir() if (p / META_FILE).exists())
+    removed = [v for v in versions[:-keep] if v != current] if keep > 0 else [v for v in versions if v != current]
+    for name in removed:
+        shutil.rmtree(root_path / name)
+    return removed
+
+class SnapshotChunkRepository(IChunkRepository):
+    """Sirve los vectores desde un snapshot en disco y delega texto y multimedia en otro repositorio.
+
+    Antes de servir comprueba si ``CURRENT`` cambió (por su mtime, una sola
+    llamada a ``stat``) y en ese caso abre el snapshot recién publicado; su
+    versión se expone en ``version`` para invalidar índice y cachés.
+    """
+    def __init__(self, source: IChunkRepository, root: str) -> None:
+        self._source = source
+        self._root = root
+        self._lock = threading.Lock()
+        self._pointer_mtime = self._stat_pointer()
+        self._snapshot = open_snapshot(root)
+
+    def _stat_pointer(self) -> Optional[int]:
+        try:
+            return os.stat(Path(self._root) / CURRENT_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _current(self) -> VectorSnapshot:
+        """Snapshot publicado en ``CURRENT``; si el puntero cambió se abre el nuevo."""
+        mtime = self._stat_pointer()
+        if mtime is not None and mtime != self._pointer_mtime:
+            with self._lock:
+                if mtime != self._pointer_mtime:
+                    # El mtime se toma antes de leer: una publicación intermedia se detecta en la próxima llamada
+                    version = current_version(self._root)
+                    if version != self._snapshot.version:
+                        self._snapshot = open_snapshot(self._root, version)
+                    self._pointer_mtime = mtime
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self._current().version
+
+    def get_all(self) -> Iterable[Chunk]:
+        return self._source.get_all()
+
+    def get_vectors(self) -> Iterable[Tuple[str, List[float]]]:
+        snapshot = self._current()
+        for chunk_id, vector in zip(snapshot.ids, snapshot.vectors):
+            yield str(chunk_id), vector.tolist()
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        return self._source.get_by_ids(ids)
+
+    async def aget_by_ids(self, ids: Sequence[str]) -> List[Chunk]:
+        return await self._source.aget_by_ids(ids)
+
+    def close(self) -> None:
+        self._source.close()
+
+    def load_index(self, dim: Optional[int] = None) -> VectorIndex:
+        snapshot = self._current()
+        if dim is not None and dim != snapshot.meta["dim"]:
+            raise ValueError(
+                f"El snapshot tiene dimensión {snapshot.meta['dim']}, se esperaba {dim}"
+            )
+        return snapshot.index()
@@ -1,4 +1,6 @@
-from sqlalchemy.orm import Session
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from fastapi import HTTPException, status
 from app.database import User, UserSettings
@@ -7,15 +9,20 @@ from app.core.security import get_password_hash, verify_password
 from datetime import datetime
 
 class UserService:
-    def __init__(self, db: Session):
+    """Usuarios y su configuración sobre una sesión asíncrona de SQLAlchemy.
+
+    El hash de contraseñas (bcrypt) es CPU intensivo y corre en un hilo para
+    no detener el event loop.
+    """
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def create_user(self, user: UserCreate) -> User:
+    async def create_user(self, user: UserCreate) -> User:
         """Crear nuevo usuario"""
         print(f"Intentando crear usuario: {user.email}, {user.username}")
         
         # Verificar que el email no exista
-        existing_email = self.get_user_by_email(user.email)
+        existing_email = await self.get_user_by_email(user.email)
         if existing_email:
             print(f"Email ya existe: {user.email}")
             raise HTTPException(
@@ -24,7 +31,7 @@ class UserService:
             )
         
         # Verificar que el username no exista
-        existing_username = self.get_user_by_username(user.username)
+        existing_username = await self.get_user_by_username(user.username)
         if existing_username:
             print(f"Username ya existe: {user.username}")
             raise HTTPException(
@@ -34,7 +41,7 @@ class UserService:
         
         print("Creando usuario...")
         # Crear usuario
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await asyncio.to_thread(get_password_hash, user.password)
         db_user = User(
             email=user.email,
             username=user.username,
@@ -44,25 +51,25 @@ class UserService:
         
         try:
             self.db.add(db_user)
-            self.db.commit()
-            self.db.refresh(db_user)
+            await self.db.commit()
+            await self.db.refresh(db_user)
             print(f"Usuario creado con ID: {db_user.id}")
             
             # Crear configuración por defecto
             print("Creando configuración por defecto...")
-            self.create_default_settings(db_user.id)
+            await self.create_default_settings(db_user.id)
             print("Configuración por defecto creada")
             
             return db_user
         except Exception as e:
             print(f"Error en base de datos: {str(e)}")
-            self.db.rollback()
+            await self.db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error al crear usuario: {str(e)}"
             )
     
-    def create_default_settings(self, user_id: int) -> UserSettings:
+    async def create_default_settings(self, user_id: int) -> UserSettings:
         """Crear configuración por defecto para usuario"""
         print(f"Creando configuración por defecto para usuario {user_id}")
         try:
@@ -96,40 +103,40 @@ class UserService:
             )
             
             self.db.add(default_settings)
-            self.db.commit()
-            self.db.refresh(default_settings)
+            await self.db.commit()
+            await self.db.refresh(default_settings)
             print(f"Configuración por defecto creada con ID: {default_settings.id}")
             
             return default_settings
         except Exception as e:
             print(f"Error creando configuración por defecto: {str(e)}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
-    def get_user_by_email(self, email: str) -> Optional[User]:
+    async def get_user_by_email(self, email: str) -> Optional[User]:
         """Obtener usuario por email"""
-        return self.db.query(User).filter(User.email == email).first()
+        return await self.db.scalar(select(User).where(User.email == email))
     
-    def get_user_by_username(self, username: str) -> Optional[User]:
+    async def get_user_by_username(self, username: str) -> Optional[User]:
         """Obtener usuario por username"""
-        return self.db.query(User).filter(User.username == username).first()
+        return await self.db.scalar(select(User).where(User.username == username))
     
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Obtener usuario por ID"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        return await self.db.scalar(select(User).where(User.id == user_id))
     
-    def authenticate_user(self, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, email: str, password: str) -> Optional[User]:
         """Autenticar usuario"""
-        user = self.get_user_by_email(email)
+        user = await self.get_user_by_email(email)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await asyncio.to_thread(verify_password, password, user.hashed_password):
             return None
         return user
     
-    def update_user(self, user_id: int, user_update: UserUpdate) -> Optional[User]:
+    async def update_user(self, user_id: int, user_update: UserUpdate) -> Optional[User]:
         """Actualizar usuario"""
-        user = self.get_user_by_id(user_id)
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
         
@@ -137,25 +144,25 @@ class UserService:
         
         # Si se actualiza la contraseña, hashearla
         if "password" in update_data:
-            update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+            update_data["hashed_password"] = await asyncio.to_thread(get_password_hash, update_data.pop("password"))
         
         # Actualizar campos
         for field, value in update_data.items():
             setattr(user, field, value)
         
         user.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
         
         return user
     
-    def get_user_settings(self, user_id: int) -> Optional[UserSettings]:
+    async def get_user_settings(self, user_id: int) -> Optional[UserSettings]:
         """Obtener configuración de usuario"""
-        return self.db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
+        return await self.db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
     
-    def update_user_settings(self, user_id: int, settings_update: UserSettingsUpdate) -> Optional[UserSettings]:
+    async def update_user_settings(self, user_id: int, settings_update: UserSettingsUpdate) -> Optional[UserSettings]:
         """Actualizar configuración de usuario"""
-        settings = self.get_user_settings(user_id)
+        settings = await self.get_user_settings(user_id)
         if not settings:
             return None
         
@@ -166,7 +173,7 @@ class UserService:
             setattr(settings, field, value)
         
         settings.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(settings)
+        await self.db.commit()
+        await self.db.refresh(settings)
         
         return settings
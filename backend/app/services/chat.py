@@ -1,9 +1,29 @@
-from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
 from app.models.chat import ChatAnswer
+from app.models.chunk import Chunk
 from app.repositories.base import IChunkRepository
-from app.services.embedding import EmbeddingService
+from app.services.embedding import EmbeddingService, normalize_query
 from app.services.llm import LLMService
+from app.services.prompt_builder import BuiltPrompt, PromptBuilder, aget_token_counter, get_token_counter, prompt_budget
+from app.services.semantic_cache import SemanticAnswerCache
+from app.services.vector_index import VectorIndex, build_index
+from app.core.cache import LRUCache
 from app.core.config import get_settings
+from app.core.singleflight import AsyncSingleFlight, SingleFlight
+
+class Retrieval(NamedTuple):
+    """Resultado de la recuperación: no depende del historial, sólo de la pregunta y la configuración."""
+    chunks: List[Chunk]
+    is_visual_query: bool
+    query_vector: Optional[List[float]] = None
+
+# Configuración del usuario que cambia la respuesta (además de la API key, que se hashea)
+ANSWER_SETTINGS = ("top_k", "min_relevance", "system_prompt", "default_model", "temperature", "max_tokens")
 
 class ChatService:
     """Alta‑nivel orquestador → cumple Dependency‑Inversion: depende de abstracciones."""
@@ -17,9 +37,191 @@ class ChatService:
         self._emb = embeddings
         self._llm = llm
         self._cfg = get_settings()
+        self._index: Optional[VectorIndex] = None
+        self._index_lock = threading.Lock()
+        # Versión del repositorio con la que se construyó el índice y última comprobación (monotonic)
+        self._index_version: Optional[str] = None
+        self._index_checked = 0.0
+        self._generation = 0
+        # Preguntas idénticas en curso se resuelven una sola vez (picos de tráfico)
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        # Respuestas por prompt exacto: con temperatura 0 el mismo prompt da la misma respuesta
+        self._answers: Optional[LRUCache] = (
+            LRUCache(self._cfg.answer_cache_size, ttl=self._cfg.answer_cache_ttl or None)
+            if self._cfg.answer_cache_size > 0 else None
+        )
+        # Preguntas parecidas con los mismos chunks y configuración reutilizan la respuesta
+        self._semantic: Optional[SemanticAnswerCache] = (
+            SemanticAnswerCache(
+                self._cfg.semantic_cache_size,
+                threshold=self._cfg.semantic_cache_threshold,
+                ttl=self._cfg.answer_cache_ttl or None,
+            )
+            if self._cfg.semantic_cache_size > 0 else None
+        )
+
+    def _get_index(self) -> VectorIndex:
+        """Índice vectorial del repositorio, construido una vez y renovado si el corpus cambia.
+
+        Cada ``index_refresh_seconds`` se compara la versión del repositorio con
+        la del índice (un repositorio sin versión se reconstruye siempre).
+        Mientras un hilo lo renueva, el resto sigue respondiendo con el anterior.
+        """
+        index = self._index
+        if index is None:
+            # Las peticiones concurrentes esperan a una única construcción
+            with self._index_lock:
+                if self._index is None:
+                    self._load_index()
+                return self._index
+        if self._index_due() and self._index_lock.acquire(blocking=False):
+            try:
+                if self._index_due():
+                    self._load_index()
+            except Exception as e:
+                # Un fallo al renovar no tumba las peticiones: se reintenta en el próximo intervalo
+                print(f"Error renovando el índice vectorial: {e}")
+            finally:
+                self._index_lock.release()
+            index = self._index
+        return index
+
+    def _index_due(self) -> bool:
+        interval = self._cfg.index_refresh_seconds
+        return interval > 0 and time.monotonic() - self._index_checked >= interval
+
+    def _load_index(self) -> None:
+        """Construye el índice salvo que ya exista para la versión actual del repositorio."""
+        self._index_checked = time.monotonic()
+        version = self._repo.version
+        if self._index is not None and version is not None and version == self._index_version:
+            return
+        index = build_index(
+            self._repo.load_index(dim=self._cfg.embedding_dim),
+            kind=self._cfg.index_type,
+            **self._index_params(),
+        )
+        if self._index is not None:
+            # Corpus nuevo: las respuestas cacheadas con el anterior dejan de coincidir
+            self._generation += 1
+        self._index, self._index_version = index, version
 
-    def _retrieve(self, query: str, k: int = 3, min_relevance: float = 0.85):
-        """Recupera chunks relevantes basados en similitud de embeddings.
+    def _index_params(self) -> dict:
+        params = {
+            "dtype": self._cfg.index_dtype,
+            "rescore": self._cfg.index_rescore,
+            "truncate_dim": self._cfg.index_dim or None,
+        }
+        if self._cfg.index_type == "ivf":
+            params.update(n_lists=self._cfg.ivf_n_lists, n_probe=self._cfg.ivf_n_probe)
+        return params
+
+    async def _aget_index(self) -> VectorIndex:
+        """Como ``_get_index``; construcción y comprobación de versión (lecturas a Mongo + numpy) van en un hilo aparte."""
+        index = self._index
+        if index is None or self._index_due():
+            index = await asyncio.to_thread(self._get_index)
+        return index
+
+    def refresh_index(self) -> None:
+        """Descarta el índice para reconstruirlo en la próxima consulta (p.e. tras cambiar el corpus)."""
+        self._index = None
+        self._generation += 1
+        if self._answers is not None:
+            self._answers.clear()
+        if self._semantic is not None:
+            self._semantic.clear()
+
+    @property
+    def corpus_version(self) -> tuple:
+        """Identifica el corpus indexado: versión del repositorio con la que se construyó y recargas del índice."""
+        return self._index_version, self._generation
+
+    def _flight_key(self, stage: str, question: str, *parts) -> str:
+        payload = json.dumps(
+            [stage, normalize_query(question), self.corpus_version, *parts],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _settings_fingerprint(user_settings: Optional[dict] = None) -> dict:
+        user_settings = user_settings or {}
+        settings = {name: user_settings.get(name) for name in ANSWER_SETTINGS}
+        api_key = user_settings.get("openai_api_key") or ""
+        settings["api_key"] = hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else None
+        return settings
+
+    def _answer_key(self, question: str, conversation_history: List[dict] = None, user_settings: Optional[dict] = None) -> str:
+        settings = self._settings_fingerprint(user_settings)
+        return self._flight_key("answer", question, settings, conversation_history or [])
+
+    def _lookup_answer(
+        self,
+        retrieval: Retrieval,
+        prompt: str,
+        images: List[str],
+        videos: List[str],
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> Tuple[Optional[ChatAnswer], Callable[[ChatAnswer], None]]:
+        """Busca la respuesta en caché; devuelve (respuesta o None, función para guardar la nueva).
+
+        Primero por prompt exacto y después por similitud de la pregunta. Con
+        temperatura por encima de ``answer_cache_max_temperature`` no se cachea.
+        """
+        model, temperature, max_tokens = self._llm.params(user_settings)
+        if temperature > self._cfg.answer_cache_max_temperature:
+            return None, lambda answer: None
+        exact_key = None
+        if self._answers is not None:
+            payload = json.dumps(
+                [model, temperature, max_tokens, prompt, images, videos, self.corpus_version],
+                ensure_ascii=False, default=str,
+            )
+            exact_key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        scope = None
+        if self._semantic is not None and retrieval.query_vector is not None:
+            payload = json.dumps(
+                [
+                    [c.id for c in retrieval.chunks], retrieval.is_visual_query,
+                    self._settings_fingerprint(user_settings), conversation_history or [],
+                    model, temperature, max_tokens, self.corpus_version,
+                ],
+                sort_keys=True, ensure_ascii=False, default=str,
+            )
+            scope = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+        cached = self._answers.get(exact_key) if exact_key is not None else None
+        if cached is None and scope is not None:
+            cached = self._semantic.get(retrieval.query_vector, scope)
+            if cached is not None and exact_key is not None:
+                self._answers.set(exact_key, cached)
+
+        def store(answer: ChatAnswer) -> None:
+            if exact_key is not None:
+                self._answers.set(exact_key, answer)
+            if scope is not None:
+                self._semantic.set(retrieval.query_vector, scope, answer)
+
+        return cached, store
+
+    @property
+    def answer_cache_stats(self) -> dict:
+        return {
+            "exact": self._answers.stats if self._answers is not None else {},
+            "semantic": self._semantic.stats if self._semantic is not None else {},
+        }
+
+    def close(self) -> None:
+        self._repo.close()
+
+    def _retrieve(self, query: str, k: int = 3, min_relevance: float = 0.85) -> Tuple[List[Chunk], List[float]]:
+        """Recupera chunks relevantes basados en similitud de embeddings; devuelve (chunks, vector de la consulta).
+
+        Trabaja en dos fases: puntúa sólo contra los vectores del índice y
+        luego pide al repositorio texto y multimedia únicamente de los ganadores.
         
         Args:
             query: La consulta del usuario
@@ -27,23 +229,25 @@ class ChatService:
             min_relevance: Umbral mínimo de relevancia (0.0 = muy relevante, 1.0 = no relevante)
         """
         q_vec = self._emb.embed(query)
-        scored = []
-        for chunk in self._repo.get_all():
-            if not chunk.texto or len(chunk.vector) != 1536:
-                continue
-            dist = self._emb.cosine_distance(q_vec, chunk.vector)
-            # Solo incluir chunks que superen el umbral de relevancia
-            if dist <= min_relevance:
-                scored.append((dist, chunk))
-
-        scored.sort(key=lambda x: x[0])
-        return [c for _, c in scored[:k]]
+        index = self._get_index()
+        # Solo incluir chunks que superen el umbral de relevancia
+        hits = index.search(q_vec, k, max_distance=min_relevance)
+        chunks = self._repo.get_by_ids([chunk_id for chunk_id, _ in hits])
+        return [c for c in chunks if c.texto], q_vec
 
-    def answer(self, question: str, conversation_history: List[dict] = None, user_settings: Optional[dict] = None) -> ChatAnswer:
+    async def _aretrieve(self, query: str, k: int = 3, min_relevance: float = 0.85) -> Tuple[List[Chunk], List[float]]:
+        """Versión asíncrona de ``_retrieve``: embedding y lectura de chunks no bloquean el event loop."""
+        q_vec = await self._emb.aembed(query)
+        index = await self._aget_index()
+        hits = index.search(q_vec, k, max_distance=min_relevance)
+        chunks = await self._repo.aget_by_ids([chunk_id for chunk_id, _ in hits])
+        return [c for c in chunks if c.texto], q_vec
+
+    def _retrieval_params(self, question: str, user_settings: Optional[dict] = None) -> Tuple[int, float, bool]:
+        """Parámetros de recuperación para la pregunta; devuelve (top_k, min_relevance, es_visual)."""
         # Usar configuración del usuario si está disponible
         top_k = user_settings.get("top_k", 3) if user_settings else 3
         min_relevance = user_settings.get("min_relevance", 0.85) if user_settings else 0.85
-        system_prompt = user_settings.get("system_prompt", "Eres un asistente experto") if user_settings else "Eres un asistente experto"
         
         # Verificar si la pregunta está relacionada con imágenes o contenido visual
         visual_keywords = [
@@ -59,39 +263,58 @@ class ChatService:
         # Si es una consulta visual, aumentar top_k para encontrar chunks con multimedia
         if is_visual_query:
             top_k = max(top_k, 6)  # Aumentar a mínimo 6 para tener más posibilidades
-        
-        chunks = self._retrieve(question, top_k, min_relevance)
-        context = "\n\n".join(c.texto for c in chunks)
-
-        # Construir el contexto de conversación
-        conversation_context = ""
-        if conversation_history:
-            # Limitar el historial a los últimos 10 mensajes para no sobrecargar el prompt
-            recent_history = conversation_history[-10:]
-            conversation_context = "\n".join([
-                f"{'Usuario' if msg['role'] == 'user' else 'Asistente'}: {msg['content']}"
-                for msg in recent_history
-            ])
-            conversation_context = f"\n\nContexto de la conversación:\n{conversation_context}\n"
-
-        prompt = (
-            f"{system_prompt}\n\n"
-            f"Contexto de la base de conocimiento:\n{context}\n\n"
-            f"{conversation_context}"
-            f"Pregunta actual del usuario: {question}\n\n"
-            "Instrucciones:\n"
-            "- Usa tanto el contexto de la base de conocimiento como el historial de conversación para dar una respuesta coherente\n"
-            "- Si la pregunta se refiere a algo mencionado anteriormente en la conversación, úsalo para dar contexto\n"
-            "- Si no sabes la respuesta basándote en el contexto proporcionado, indícalo claramente\n"
-            "- Mantén la coherencia con las respuestas anteriores en la conversación"
+        return top_k, min_relevance, is_visual_query
+
+    def _build_prompt(
+        self,
+        question: str,
+        chunks: List[Chunk],
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> BuiltPrompt:
+        """Prompt dentro del presupuesto de tokens del modelo (ver ``PromptBuilder``)."""
+        system_prompt = user_settings.get("system_prompt", "Eres un asistente experto") if user_settings else "Eres un asistente experto"
+        model, _, max_tokens = self._llm.params(user_settings)
+        builder = PromptBuilder(
+            get_token_counter(model),
+            prompt_budget(model, max_tokens, self._cfg.prompt_max_tokens),
         )
-        
-        # Pasar configuración del usuario al LLM si está disponible
-        if user_settings:
-            raw_answer = self._llm.ask(prompt, user_settings)
-        else:
-            raw_answer = self._llm.ask(prompt)
+        return builder.build(system_prompt, question, [c.texto for c in chunks], conversation_history)
+
+    def retrieve(self, question: str, user_settings: Optional[dict] = None) -> Retrieval:
+        top_k, min_relevance, is_visual_query = self._retrieval_params(question, user_settings)
+        chunks, q_vec = self._retrieve(question, top_k, min_relevance)
+        return Retrieval(chunks, is_visual_query, q_vec)
+
+    def _compose(
+        self,
+        question: str,
+        retrieval: Retrieval,
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> Tuple[BuiltPrompt, List[str], List[str]]:
+        built = self._build_prompt(question, retrieval.chunks, conversation_history, user_settings)
+        # La multimedia sale sólo de los chunks que entraron en el prompt
+        images, videos = self._select_media(retrieval.chunks[:built.chunks_used], retrieval.is_visual_query)
+        return built, images, videos
+
+    async def aretrieve(self, question: str, user_settings: Optional[dict] = None) -> Retrieval:
+        """Primera etapa de ``aanswer``; puede correr a la vez que se carga el historial.
+
+        Deja cargado el tokenizador del modelo para que el prompt de la segunda
+        etapa no bloquee el event loop.
+        """
+        await aget_token_counter(self._llm.params(user_settings)[0])
+        top_k, min_relevance, is_visual_query = self._retrieval_params(question, user_settings)
+
+        async def retrieve() -> Retrieval:
+            chunks, q_vec = await self._aretrieve(question, top_k, min_relevance)
+            return Retrieval(chunks, is_visual_query, q_vec)
+
+        key = self._flight_key("retrieval", question, top_k, min_relevance, is_visual_query)
+        return await self._aflight.do(key, retrieve)
 
+    def _select_media(self, chunks: List[Chunk], is_visual_query: bool) -> Tuple[List[str], List[str]]:
         # Incluir imágenes y videos con filtrado ultra-selectivo
         images: List[str] = []
         videos: List[str] = []
@@ -128,5 +351,105 @@ class ChatService:
         # Remover duplicados manteniendo el orden
         images = list(dict.fromkeys(images))
         videos = list(dict.fromkeys(videos))
+        return images, videos
+
+    def answer(self, question: str, conversation_history: List[dict] = None, user_settings: Optional[dict] = None) -> ChatAnswer:
+        key = self._answer_key(question, conversation_history, user_settings)
+        answer = self._flight.do(key, lambda: self._answer(question, conversation_history, user_settings))
+        # Cada llamador recibe su propia copia del resultado compartido
+        return answer.model_copy(deep=True)
+
+    def _answer(self, question: str, conversation_history: List[dict] = None, user_settings: Optional[dict] = None) -> ChatAnswer:
+        retrieval = self.retrieve(question, user_settings)
+        built, images, videos = self._compose(question, retrieval, conversation_history, user_settings)
+        prompt = built.text
+        cached, store = self._lookup_answer(retrieval, prompt, images, videos, conversation_history, user_settings)
+        if cached is not None:
+            return cached
+
+        # Pasar configuración del usuario al LLM si está disponible
+        if user_settings:
+            raw_answer = self._llm.ask(prompt, user_settings)
+        else:
+            raw_answer = self._llm.ask(prompt)
+
+        answer = ChatAnswer(answer=raw_answer, images=images, videos=videos, prompt_tokens=built.tokens)
+        store(answer)
+        return answer
+
+    async def aanswer(
+        self,
+        question: str,
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> ChatAnswer:
+        """Como ``answer`` pero con E/S asíncrona de punta a punta (OpenAI y MongoDB)."""
+        retrieval = await self.aretrieve(question, user_settings)
+        return await self.agenerate(question, retrieval, conversation_history, user_settings)
+
+    async def agenerate(
+        self,
+        question: str,
+        retrieval: Retrieval,
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> ChatAnswer:
+        """Segunda etapa de ``aanswer``: prompt con contexto e historial y llamada al LLM."""
+        async def generate() -> ChatAnswer:
+            built, images, videos = self._compose(question, retrieval, conversation_history, user_settings)
+            prompt = built.text
+            cached, store = self._lookup_answer(retrieval, prompt, images, videos, conversation_history, user_settings)
+            if cached is not None:
+                return cached
+            raw_answer = await self._llm.aask(prompt, user_settings)
+            answer = ChatAnswer(answer=raw_answer, images=images, videos=videos, prompt_tokens=built.tokens)
+            store(answer)
+            return answer
+
+        key = self._answer_key(question, conversation_history, user_settings)
+        answer = await self._aflight.do(key, generate)
+        return answer.model_copy(deep=True)
+
+    async def astream_answer(
+        self,
+        question: str,
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> Tuple[ChatAnswer, AsyncIterator[str]]:
+        """Como ``aanswer`` pero sin esperar al LLM.
+
+        Devuelve en cuanto termina la recuperación la multimedia (en un
+        ``ChatAnswer`` con la respuesta vacía) y un iterador asíncrono con los
+        fragmentos de texto a medida que el modelo los genera.
+        """
+        retrieval = await self.aretrieve(question, user_settings)
+        return self.generate_stream(question, retrieval, conversation_history, user_settings)
+
+    def generate_stream(
+        self,
+        question: str,
+        retrieval: Retrieval,
+        conversation_history: List[dict] = None,
+        user_settings: Optional[dict] = None,
+    ) -> Tuple[ChatAnswer, AsyncIterator[str]]:
+        """Como ``agenerate`` pero devuelve la multimedia y el iterador asíncrono de fragmentos.
+
+        Una respuesta cacheada se emite como un único fragmento; un stream que
+        termina completo se guarda en la caché.
+        """
+        built, images, videos = self._compose(question, retrieval, conversation_history, user_settings)
+        prompt = built.text
+        media = ChatAnswer(answer="", images=images, videos=videos, prompt_tokens=built.tokens)
+        cached, store = self._lookup_answer(retrieval, prompt, images, videos, conversation_history, user_settings)
+
+        async def tokens() -> AsyncIterator[str]:
+            if cached is not None:
+                yield cached.answer
+                return
+            parts = []
+            async for token in self._llm.astream(prompt, user_settings):
+                parts.append(token)
+                yield token
+            store(ChatAnswer(answer="".join(parts), images=images, videos=videos, prompt_tokens=built.tokens))
 
-        return ChatAnswer(answer=raw_answer, images=images, videos=videos)
+        return media, tokens()
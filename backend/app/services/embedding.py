@@ -1,22 +1,208 @@
-from typing import List
+import asyncio
+import queue
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
 import numpy as np
 from langchain_openai.embeddings import OpenAIEmbeddings
-from app.core.config import get_settings
+from app.core.cache import LRUCache
+from app.core.config import EMBEDDING_DIMENSIONS, get_settings
+from app.services.embedding_cache import SQLiteEmbeddingCache
+
+def normalize_query(text: str) -> str:
+    """Forma canónica de una consulta para usarla como clave de caché."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+class EmbeddingBatcher:
+    """Agrupa consultas concurrentes en una sola llamada ``embed_documents``.
+
+    Un hilo recolector espera hasta ``window_ms`` (o hasta ``max_batch``
+    textos) desde la primera consulta pendiente, envía el lote a OpenAI en un
+    hilo aparte (como máximo ``concurrency`` lotes en vuelo) y reparte cada
+    vector al llamador que lo pidió. El recolector termina tras ``idle_timeout``
+    segundos sin trabajo y se vuelve a arrancar con la siguiente consulta.
+    """
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], List[List[float]]],
+        window_ms: float = 5.0,
+        max_batch: int = 32,
+        concurrency: int = 4,
+        idle_timeout: float = 30.0,
+    ) -> None:
+        self._embed_many = embed_many
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._idle_timeout = idle_timeout
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._in_flight = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._queue.put((text, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+                self._thread.start()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._in_flight.acquire()
+            threading.Thread(target=self._flush, args=(batch,), daemon=True).start()
+
+    def _flush(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            # Los futuros cancelados (p.e. petición abortada) se descartan; el resto ya no se puede cancelar
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                return
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self._embed_many(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            for text, future in batch:
+                future.set_result(vectors[text])
+        finally:
+            self._in_flight.release()
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0,
+        }
 
 class EmbeddingService:
     """Responsabilidad única: convertir texto en vectores."""
     def __init__(self) -> None:
         cfg = get_settings()
+        # Con una dimensión distinta de la nativa se pide a la API ya reducida (parámetro ``dimensions``
+        # de text-embedding-3): las consultas deben tener la misma dimensión que el índice
+        dimensions = None
+        if cfg.embedding_dimension and cfg.embedding_dimension != EMBEDDING_DIMENSIONS.get(cfg.embedding_model_name):
+            if not cfg.embedding_model_name.startswith("text-embedding-3"):
+                raise ValueError(
+                    f"El modelo {cfg.embedding_model_name} no admite embedding_dimension={cfg.embedding_dimension}"
+                )
+            dimensions = cfg.embedding_dimension
+        # La dimensión forma parte de la clave de caché: vectores de otra dimensión no se reutilizan
+        self._model_name = cfg.embedding_model_name if dimensions is None else f"{cfg.embedding_model_name}:{dimensions}"
         self._model = OpenAIEmbeddings(
             model=cfg.embedding_model_name,
-            openai_api_key=cfg.OPENAI_API_KEY
+            openai_api_key=cfg.OPENAI_API_KEY,
+            dimensions=dimensions,
         )
+        # Caché de consultas repetidas (FAQ, reintentos): evita el viaje a OpenAI
+        self._cache = (
+            LRUCache(cfg.embedding_cache_size, ttl=cfg.embedding_cache_ttl or None)
+            if cfg.embedding_cache_size > 0 else None
+        )
+        # Micro‑batching de consultas concurrentes (ventana 0 = una llamada por consulta)
+        self._batcher: Optional[EmbeddingBatcher] = (
+            EmbeddingBatcher(
+                lambda texts: self._model.embed_documents(texts),
+                window_ms=cfg.embedding_batch_window_ms,
+                max_batch=cfg.embedding_batch_max_size,
+            )
+            if cfg.embedding_batch_window_ms > 0 else None
+        )
+        # Caché opcional en disco: sobrevive a reinicios y la comparten los workers del host
+        self._disk_cache: Optional[SQLiteEmbeddingCache] = (
+            SQLiteEmbeddingCache(cfg.embedding_disk_cache_path, cfg.embedding_disk_cache_max_entries)
+            if cfg.embedding_disk_cache_path else None
+        )
+
+    def _cache_key(self, text: str) -> Tuple[str, str]:
+        return self._model_name, normalize_query(text)
 
     def embed(self, text: str) -> List[float]:
-        return self._model.embed_query(text)
+        key = self._cache_key(text)
+        cached = self._cache.get(key) if self._cache is not None else None
+        if cached is None:
+            vector = self._disk_cache.get(*key) if self._disk_cache is not None else None
+            if vector is None:
+                vector = self._batcher.embed(text) if self._batcher is not None else self._model.embed_query(text)
+                if self._disk_cache is not None:
+                    self._disk_cache.set(*key, vector)
+            cached = tuple(vector)
+            if self._cache is not None:
+                self._cache.set(key, cached)
+        return list(cached)
+
+    async def aembed(self, text: str) -> List[float]:
+        """Como ``embed`` pero sin bloquear el event loop.
+
+        Con micro‑batching se espera el futuro del lote (la llamada a OpenAI
+        ocurre en el hilo del batcher); sin él se usa ``aembed_query``. La caché
+        en disco es SQLite local y se consulta en un hilo aparte.
+        """
+        key = self._cache_key(text)
+        cached = self._cache.get(key) if self._cache is not None else None
+        if cached is None:
+            vector = await asyncio.to_thread(self._disk_cache.get, *key) if self._disk_cache is not None else None
+            if vector is None:
+                if self._batcher is not None:
+                    vector = await asyncio.wrap_future(self._batcher.submit(text))
+                else:
+                    vector = await self._model.aembed_query(text)
+                if self._disk_cache is not None:
+                    await asyncio.to_thread(self._disk_cache.set, *key, vector)
+            cached = tuple(vector)
+            if self._cache is not None:
+                self._cache.set(key, cached)
+        return list(cached)
+
+    @property
+    def cache_stats(self) -> Dict[str, dict]:
+        return {
+            "memory": self._cache.stats if self._cache is not None else {},
+            "disk": self._disk_cache.stats if self._disk_cache is not None else {},
+            "batching": self._batcher.stats if self._batcher is not None else {},
+        }
+
+    def close(self) -> None:
+        if self._disk_cache is not None:
+            self._disk_cache.close()
 
     @staticmethod
     def cosine_distance(a: List[float], b: List[float]) -> float:
         a_np, b_np = np.array(a, dtype=np.float32), np.array(b, dtype=np.float32)
         sim = np.dot(a_np, b_np) / (np.linalg.norm(a_np) * np.linalg.norm(b_np))
-        return 1 - float(sim)
\ No newline at end of file
+        return 1 - float(sim)
@@ -0,0 +1,127 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import numpy as np
+
+class SQLiteEmbeddingCache:
+    """Caché persistente de embeddings en un archivo SQLite compartido por todos los workers.
+
+    Los vectores se guardan como blobs float32 bajo un hash de (modelo, texto).
+    WAL permite lectores concurrentes mientras otro proceso escribe y el
+    ``busy_timeout`` reintenta en lugar de fallar con "database is locked".
+    Cuando se supera ``max_entries`` se desalojan las entradas con el acceso
+    más antiguo. Cualquier error de SQLite se trata como un fallo de caché:
+    la caché nunca debe tumbar una petición.
+    """
+    # Para no escribir en cada lectura, el acceso sólo se actualiza si es más viejo que esto
+    _touch_interval = 60.0
+    # Cada cuántas escrituras se comprueba el límite de tamaño
+    _prune_every = 100
+
+    def __init__(self, path: str, max_entries: int = 100_000, busy_timeout_ms: int = 5000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        # Todas las conexiones abiertas (de cualquier hilo), para cerrarlas en ``close``
+        self._connections: Set[sqlite3.Connection] = set()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key BLOB PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " accessed_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_accessed_at ON embeddings (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Una conexión por hilo; sólo ``close`` la toca desde otro hilo (de ahí ``check_same_thread=False``)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn not in self._connections:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self._busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self._busy_timeout_ms}")
+            with self._lock:
+                self._connections.add(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model, text)
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT vector, accessed_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] > self._touch_interval:
+                conn.execute("UPDATE embeddings SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"Error leyendo caché de embeddings: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def set(self, model: str, text: str, vector: List[float]) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                (self.make_key(model, text), blob, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self._prune_every == 0:
+                self.prune()
+        except sqlite3.Error as e:
+            print(f"Error escribiendo caché de embeddings: {e}")
+
+    def prune(self) -> int:
+        """Desaloja las entradas menos usadas recientemente por encima de ``max_entries``."""
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?"
+            ")",
+            (excess,),
+        )
+        return excess
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "max_entries": self.max_entries}
+
+    def close(self) -> None:
+        """Cierra las conexiones de todos los hilos; un uso posterior abre una nueva."""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
@@ -1,33 +1,41 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 from typing import List, Optional
-from app.database import ChatSession, ChatMessage
+from app.database import ChatSession, ChatMessage, message_preview
+from app.core.pagination import Position
 from app.models.history import ChatSessionCreate, ChatMessageCreate
 from datetime import datetime
 
 class ChatHistoryService:
-    def __init__(self, db: Session):
+    """Historial de chat sobre una sesión asíncrona de SQLAlchemy.
+
+    Las relaciones no se cargan de forma perezosa (no está permitido con
+    ``AsyncSession``): los mensajes se piden siempre con consultas explícitas.
+    """
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def create_session(self, title: str, user_id: Optional[int] = None) -> ChatSession:
+    async def create_session(self, title: str, user_id: Optional[int] = None) -> ChatSession:
         """Crear una nueva sesión de chat"""
         session = ChatSession(title=title, user_id=user_id)
         self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
+        await self.db.commit()
+        await self.db.refresh(session)
         return session
     
-    def get_session(self, session_id: int) -> Optional[ChatSession]:
-        """Obtener una sesión específica con todos sus mensajes"""
-        return self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    async def get_session(self, session_id: int) -> Optional[ChatSession]:
+        """Obtener una sesión específica (sin sus mensajes)"""
+        return await self.db.scalar(select(ChatSession).where(ChatSession.id == session_id))
     
-    def get_all_sessions(self, user_id: Optional[int] = None) -> List[ChatSession]:
+    async def get_all_sessions(self, user_id: Optional[int] = None) -> List[ChatSession]:
         """Obtener todas las sesiones ordenadas por fecha de actualización"""
-        query = self.db.query(ChatSession)
+        query = select(ChatSession)
         if user_id is not None:
-            query = query.filter(ChatSession.user_id == user_id)
-        return query.order_by(ChatSession.updated_at.desc()).all()
+            query = query.where(ChatSession.user_id == user_id)
+        return list(await self.db.scalars(query.order_by(ChatSession.updated_at.desc())))
     
-    def add_message(self, session_id: int, role: str, content: str) -> ChatMessage:
+    async def add_message(self, session_id: int, role: str, content: str) -> ChatMessage:
         """Agregar un mensaje a una sesión"""
         message = ChatMessage(
             session_id=session_id,
@@ -36,39 +44,119 @@ class ChatHistoryService:
         )
         self.db.add(message)
         
-        # Actualizar timestamp de la sesión
-        session = self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
-        if session:
-            session.updated_at = datetime.utcnow()
+        # Actualizar timestamp y contadores del listado de la sesión con un único UPDATE
+        # (sin leerla antes: la transacción empieza escribiendo y no compite por el lock
+        # con una lectura previa; el incremento en SQL no pierde mensajes concurrentes).
+        # "fetch" refresca la sesión si ya está cargada usando RETURNING, sin otra consulta
+        values = {
+            ChatSession.updated_at: datetime.utcnow(),
+            ChatSession.message_count: ChatSession.message_count + 1,
+        }
+        if role == "user":
+            values[ChatSession.last_user_preview] = message_preview(content)
+        await self.db.execute(
+            update(ChatSession).where(ChatSession.id == session_id).values(values),
+            execution_options={"synchronize_session": "fetch"},
+        )
         
-        self.db.commit()
-        self.db.refresh(message)
+        # Sin refresh: con expire_on_commit=False el mensaje ya tiene id y created_at
+        await self.db.commit()
         return message
     
-    def delete_session(self, session_id: int) -> bool:
+    async def delete_session(self, session_id: int) -> bool:
         """Eliminar una sesión y todos sus mensajes"""
-        session = self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        session = await self.get_session(session_id)
         if session:
-            self.db.delete(session)
-            self.db.commit()
+            await self.db.delete(session)
+            await self.db.commit()
             return True
         return False
     
-    def update_session_title(self, session_id: int, new_title: str) -> bool:
+    async def update_session_title(self, session_id: int, new_title: str) -> bool:
         """Actualizar el título de una sesión"""
-        session = self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        session = await self.get_session(session_id)
         if session:
             session.title = new_title
             session.updated_at = datetime.utcnow()
-            self.db.commit()
+            await self.db.commit()
             return True
         return False
     
-    def get_session_messages(self, session_id: int) -> List[ChatMessage]:
+    async def get_session_messages(self, session_id: int) -> List[ChatMessage]:
         """Obtener todos los mensajes de una sesión"""
-        return self.db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at.asc()).all()
+        return list(await self.db.scalars(
+            select(ChatMessage).where(
+                ChatMessage.session_id == session_id
+            ).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        ))
+    
+    @staticmethod
+    def _keyset(sort_column, id_column, position: Position, newer: bool):
+        """Condición de keyset: filas posteriores (o anteriores) a ``position`` en el orden (sort_column, id)."""
+        value, row_id = position
+        if newer:
+            return or_(sort_column > value, and_(sort_column == value, id_column > row_id))
+        return or_(sort_column < value, and_(sort_column == value, id_column < row_id))
+    
+    async def get_recent_messages(self, session_id: int, limit: int, before: Optional[Position] = None) -> List[ChatMessage]:
+        """Últimos ``limit`` mensajes (anteriores a la posición ``before`` si se indica) en orden cronológico.
+
+        Recorre el índice (session_id, created_at) desde el final: el coste no
+        depende de la longitud de la sesión.
+        """
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if before is not None:
+            query = query.where(self._keyset(ChatMessage.created_at, ChatMessage.id, before, newer=False))
+        messages = list(await self.db.scalars(query.order_by(
+            ChatMessage.created_at.desc(), ChatMessage.id.desc()
+        ).limit(limit)))
+        return list(reversed(messages))
+    
+    async def get_messages_after(self, session_id: int, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[ChatMessage]:
+        """Mensajes posteriores a ``after_id`` (desde el principio si es None) en orden cronológico."""
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if after_id is not None:
+            anchor = select(ChatMessage.created_at).where(
+                ChatMessage.id == after_id, ChatMessage.session_id == session_id
+            ).scalar_subquery()
+            query = query.where(self._keyset(ChatMessage.created_at, ChatMessage.id, (anchor, after_id), newer=True))
+        query = query.order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        if limit is not None:
+            query = query.limit(limit)
+        return list(await self.db.scalars(query))
+    
+    async def get_conversation_context(self, session, recent: int) -> List[dict]:
+        """Historial para el prompt: resumen de lo antiguo más los últimos ``recent`` mensajes literales.
+
+        El resumen va como primer elemento con rol ``summary``.
+        """
+        history = []
+        if session.summary:
+            history.append({"role": "summary", "content": session.summary})
+        history.extend(
+            {"role": msg.role, "content": msg.content}
+            for msg in await self.get_recent_messages(session.id, recent)
+        )
+        return history
+    
+    async def save_summary(self, session_id: int, summary: str, last_message_id: int, previous_message_id: Optional[int]) -> bool:
+        """Guarda el resumen sólo si nadie lo actualizó desde ``previous_message_id`` (resúmenes concurrentes)."""
+        query = update(ChatSession).where(ChatSession.id == session_id)
+        if previous_message_id is None:
+            query = query.where(ChatSession.summary_message_id.is_(None))
+        else:
+            query = query.where(ChatSession.summary_message_id == previous_message_id)
+        result = await self.db.execute(
+            query.values({
+                ChatSession.summary: summary,
+                ChatSession.summary_message_id: last_message_id,
+                # Resumir no es actividad del usuario: no reordenar la lista de sesiones
+                ChatSession.updated_at: ChatSession.updated_at,
+            }),
+            execution_options={"synchronize_session": "fetch"},
+        )
+        await self.db.commit()
+        return bool(result.rowcount)
     
     def generate_session_title(self, first_message: str) -> str:
         """Generar un título para la sesión basado en el primer mensaje"""
@@ -79,40 +167,55 @@ class ChatHistoryService:
         return title
     
     # Métodos específicos de usuario
-    def get_user_sessions(self, user_id: int) -> List[ChatSession]:
-        """Obtener todas las sesiones de un usuario específico"""
-        return self.db.query(ChatSession).filter(
+    async def get_user_sessions(
+        self, user_id: int, limit: Optional[int] = None, before: Optional[Position] = None
+    ) -> List[ChatSession]:
+        """Sesiones de un usuario de la más reciente a la más antigua (sólo las columnas del listado).
+
+        Con ``before`` empieza después de esa posición (updated_at, id), de modo
+        que cada página es un recorrido acotado del índice (user_id, updated_at).
+        """
+        query = select(ChatSession).options(
+            load_only(
+                ChatSession.id,
+                ChatSession.title,
+                ChatSession.created_at,
+                ChatSession.updated_at,
+                ChatSession.message_count,
+                ChatSession.last_user_preview,
+            )
+        ).where(
             ChatSession.user_id == user_id
-        ).order_by(ChatSession.updated_at.desc()).all()
+        )
+        if before is not None:
+            query = query.where(self._keyset(ChatSession.updated_at, ChatSession.id, before, newer=False))
+        query = query.order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return list(await self.db.scalars(query))
     
-    def get_user_session(self, user_id: int, session_id: int) -> Optional[ChatSession]:
+    async def get_user_session(self, user_id: int, session_id: int) -> Optional[ChatSession]:
         """Obtener una sesión específica que pertenece al usuario"""
-        return self.db.query(ChatSession).filter(
+        return await self.db.scalar(select(ChatSession).where(
             ChatSession.id == session_id,
             ChatSession.user_id == user_id
-        ).first()
+        ))
     
-    def delete_user_session(self, user_id: int, session_id: int) -> bool:
+    async def delete_user_session(self, user_id: int, session_id: int) -> bool:
         """Eliminar una sesión que pertenece al usuario"""
-        session = self.db.query(ChatSession).filter(
-            ChatSession.id == session_id,
-            ChatSession.user_id == user_id
-        ).first()
+        session = await self.get_user_session(user_id, session_id)
         if session:
-            self.db.delete(session)
-            self.db.commit()
+            await self.db.delete(session)
+            await self.db.commit()
             return True
         return False
     
-    def update_user_session_title(self, user_id: int, session_id: int, new_title: str) -> bool:
+    async def update_user_session_title(self, user_id: int, session_id: int, new_title: str) -> bool:
         """Actualizar el título de una sesión que pertenece al usuario"""
-        session = self.db.query(ChatSession).filter(
-            ChatSession.id == session_id,
-            ChatSession.user_id == user_id
-        ).first()
+        session = await self.get_user_session(user_id, session_id)
         if session:
             session.title = new_title
             session.updated_at = datetime.utcnow()
-            self.db.commit()
+            await self.db.commit()
             return True
         return False
@@ -1,30 +1,30 @@
+import hashlib
+from functools import lru_cache
 from langchain.chat_models import ChatOpenAI
+from app.core.cache import LRUCache
 from app.core.config import get_settings
-from typing import Optional
+from typing import AsyncIterator, Dict, Optional, Tuple
 
-class LLMService:
-    def __init__(self) -> None:
-        cfg = get_settings()
-        self._cfg = cfg
-        self._chat = ChatOpenAI(
-            model_name=cfg.llm_model_name,
-            temperature=cfg.llm_temperature,
-            openai_api_key=cfg.OPENAI_API_KEY.get_secret_value(),
-            max_tokens=1000,  # Limitar tokens para respuestas más rápidas
-            timeout=30,  # Timeout de 30 segundos
-            max_retries=2,  # Máximo 2 reintentos
-        )
+class ChatClientRegistry:
+    """Clientes ChatOpenAI reutilizables, uno por configuración distinta.
 
-    def ask(self, prompt: str, user_settings: Optional[dict] = None) -> str:
-        # Usar configuración del usuario si está disponible
-        if user_settings:
-            api_key = user_settings.get("openai_api_key") or self._cfg.OPENAI_API_KEY.get_secret_value()
-            model = user_settings.get("default_model", self._cfg.llm_model_name)
-            temperature = user_settings.get("temperature", self._cfg.llm_temperature)
-            max_tokens = user_settings.get("max_tokens", 1000)
-            
-            # Crear instancia temporal con configuración del usuario
-            chat = ChatOpenAI(
+    Cada cliente mantiene su propio pool HTTP con conexiones keep‑alive, así
+    que reutilizarlo evita el handshake TLS en cada respuesta. La clave usa un
+    hash de la API key (nunca la clave en claro) y el LRU acota cuántos hay vivos.
+    """
+    def __init__(self, maxsize: int = 32) -> None:
+        self._clients = LRUCache(maxsize)
+
+    @staticmethod
+    def make_key(api_key: str, model: str, temperature: float, max_tokens: int) -> tuple:
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        return key_hash, model, float(temperature), int(max_tokens)
+
+    def get(self, api_key: str, model: str, temperature: float, max_tokens: int) -> ChatOpenAI:
+        key = self.make_key(api_key, model, temperature, max_tokens)
+        client = self._clients.get(key)
+        if client is None:
+            client = ChatOpenAI(
                 model_name=model,
                 temperature=temperature,
                 openai_api_key=api_key,
@@ -32,8 +32,61 @@ class LLMService:
                 timeout=30,
                 max_retries=2,
             )
-            response = chat.invoke(prompt)
-        else:
-            response = self._chat.invoke(prompt)
+            self._clients.set(key, client)
+        return client
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self._clients.stats
+
+@lru_cache
+def get_client_registry() -> ChatClientRegistry:
+    """Registro compartido por todas las instancias de LLMService del proceso."""
+    return ChatClientRegistry(get_settings().llm_client_pool_size)
+
+class LLMService:
+    def __init__(self, clients: Optional[ChatClientRegistry] = None) -> None:
+        cfg = get_settings()
+        self._cfg = cfg
+        self._clients = clients or get_client_registry()
+        # Cliente por defecto (timeout 30 s, 2 reintentos), también compartido vía registro
+        self._chat = self._clients.get(
+            cfg.OPENAI_API_KEY.get_secret_value(),
+            cfg.llm_model_name,
+            cfg.llm_temperature,
+            1000,  # Limitar tokens para respuestas más rápidas
+        )
+
+    def params(self, user_settings: Optional[dict] = None) -> Tuple[str, float, int]:
+        """Modelo, temperatura y máximo de tokens efectivos para la configuración dada."""
+        if not user_settings:
+            return self._cfg.llm_model_name, self._cfg.llm_temperature, 1000
+        model = user_settings.get("default_model", self._cfg.llm_model_name)
+        temperature = user_settings.get("temperature", self._cfg.llm_temperature)
+        max_tokens = user_settings.get("max_tokens", 1000)
+        return model, temperature, max_tokens
+
+    def _client(self, user_settings: Optional[dict] = None) -> ChatOpenAI:
+        # Usar configuración del usuario si está disponible
+        if not user_settings:
+            return self._chat
+
+        api_key = user_settings.get("openai_api_key") or self._cfg.OPENAI_API_KEY.get_secret_value()
+        model, temperature, max_tokens = self.params(user_settings)
         
+        # Reutilizar el cliente de cualquier petición con la misma configuración
+        return self._clients.get(api_key, model, temperature, max_tokens)
+
+    def ask(self, prompt: str, user_settings: Optional[dict] = None) -> str:
+        response = self._client(user_settings).invoke(prompt)
         return response.content
+
+    async def aask(self, prompt: str, user_settings: Optional[dict] = None) -> str:
+        response = await self._client(user_settings).ainvoke(prompt)
+        return response.content
+
+    async def astream(self, prompt: str, user_settings: Optional[dict] = None) -> AsyncIterator[str]:
+        """Fragmentos de la respuesta a medida que el modelo los genera (cliente HTTP asíncrono de OpenAI)."""
+        async for chunk in self._client(user_settings).astream(prompt):
+            if chunk.content:
+                yield chunk.content
@@ -0,0 +1,230 @@
+import asyncio
+import math
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Set
+
+# Ventana de contexto (tokens) por modelo; los desconocidos usan DEFAULT_CONTEXT_WINDOW
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-4-turbo": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+INSTRUCTIONS = (
+    "Instrucciones:\n"
+    "- Usa tanto el contexto de la base de conocimiento como el historial de conversación para dar una respuesta coherente\n"
+    "- Si la pregunta se refiere a algo mencionado anteriormente en la conversación, úsalo para dar contexto\n"
+    "- Si no sabes la respuesta basándote en el contexto proporcionado, indícalo claramente\n"
+    "- Mantén la coherencia con las respuestas anteriores en la conversación"
+)
+
+class TokenCounter:
+    """Cuenta y recorta tokens con tiktoken; sin él (o sin su archivo de codificación) estima ~4 caracteres por token."""
+    chars_per_token = 4
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self._encoding = None
+        try:
+            import tiktoken
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"tiktoken no disponible para {model}, se estiman los tokens: {e}")
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Los primeros ``max_tokens`` tokens de ``text``."""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text)
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+        return text[: max_tokens * self.chars_per_token]
+
+@lru_cache(maxsize=16)
+def get_token_counter(model: str) -> TokenCounter:
+    """Un contador por modelo: cargar la codificación de tiktoken es caro."""
+    return TokenCounter(model)
+
+# Modelos cuya codificación ya se cargó en este proceso
+_loaded_models: Set[str] = set()
+
+async def aget_token_counter(model: str) -> TokenCounter:
+    """``get_token_counter`` para el event loop.
+
+    La primera vez por modelo tiktoken puede descargar el archivo BPE, así que
+    esa carga se hace en un hilo; las siguientes salen directamente de la caché.
+    """
+    if model not in _loaded_models:
+        await asyncio.to_thread(get_token_counter, model)
+        _loaded_models.add(model)
+    return get_token_counter(model)
+
+def prompt_budget(model: str, completion_tokens: int, max_prompt_tokens: int = 0) -> int:
+    """Tokens disponibles para el prompt: la ventana del modelo menos la respuesta, acotada por ``max_prompt_tokens``."""
+    window = MODEL_CONTEXT_WINDOWS.get(model)
+    if window is None:
+        # Variantes con fecha (p.e. "gpt-4o-mini-2024-07-18"): prefijo más largo conocido
+        prefixes = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+        window = MODEL_CONTEXT_WINDOWS[max(prefixes, key=len)] if prefixes else DEFAULT_CONTEXT_WINDOW
+    budget = window - completion_tokens
+    if max_prompt_tokens > 0:
+        budget = min(budget, max_prompt_tokens)
+    return max(budget, 0)
+
+class BuiltPrompt(NamedTuple):
+    text: str
+    tokens: int
+    budget: int
+    chunks_used: int
+    chunks_dropped: int
+    history_used: int
+    truncated: bool
+
+class PromptBuilder:
+    """Arma el prompt del chat dentro de un presupuesto de tokens.
+
+    Prioridad: instrucciones y pregunta, prompt de sistema (recortado si no
+    cabe entero), chunks en orden de relevancia, resumen de la conversación
+    (entrada del historial con rol ``summary``) y, con lo que sobre, el
+    historial más reciente. Si el presupuesto no alcanza ni para las
+    instrucciones y parte de la pregunta se lanza ``ValueError``: nunca se
+    devuelve un prompt sin pregunta o por encima del presupuesto. Un chunk que
+    no cabe entero se recorta si quedan al menos ``min_chunk_tokens``; a
+    partir de ahí se descartan los demás. El historial se añade del mensaje
+    más nuevo al más viejo y se corta en el primero que no cabe, para no
+    dejar huecos en la conversación.
+    """
+    def __init__(
+        self,
+        counter: TokenCounter,
+        budget: int,
+        max_history: int = 10,
+        min_chunk_tokens: int = 64,
+    ) -> None:
+        self._counter = counter
+        self.budget = budget
+        self.max_history = max_history
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def build(
+        self,
+        system_prompt: str,
+        question: str,
+        chunks: Sequence[str],
+        conversation_history: Optional[List[dict]] = None,
+    ) -> BuiltPrompt:
+        count = self._counter.count
+        truncated = False
+        fixed = count(f"\n\nContexto de la base de conocimiento:\n\n\nPregunta actual del usuario: \n\n{INSTRUCTIONS}")
+        remaining = self.budget - fixed
+        # La pregunta se reserva antes que el prompt de sistema: uno configurado por el usuario no puede dejarla fuera
+        question_tokens = count(question)
+        if question_tokens > remaining:
+            if remaining <= 0:
+                raise ValueError(
+                    f"Presupuesto de {self.budget} tokens insuficiente para las instrucciones y la pregunta"
+                )
+            question = self._counter.truncate(question, remaining)
+            question_tokens = count(question)
+            truncated = True
+        remaining -= question_tokens
+        system_tokens = count(system_prompt)
+        if system_tokens > remaining:
+            system_prompt = self._counter.truncate(system_prompt, remaining)
+            system_tokens = count(system_prompt)
+            truncated = True
+        remaining -= system_tokens
+
+        # Chunks por orden de relevancia
+        context_parts: List[str] = []
+        for texto in chunks:
+            cost = count(texto) + 1  # separador
+            if cost <= remaining:
+                context_parts.append(texto)
+                remaining -= cost
+                continue
+            truncated = True
+            if remaining - 1 >= self.min_chunk_tokens:
+                context_parts.append(self._counter.truncate(texto, remaining - 1))
+                remaining = 0
+            break
+        chunks_used = len(context_parts)
+
+        history = conversation_history or []
+        summary = next((msg["content"] for msg in history if msg["role"] == "summary"), None)
+        messages = [msg for msg in history if msg["role"] != "summary"]
+
+        # Historial: resumen de lo antiguo y luego del mensaje más reciente hacia atrás mientras quepa
+        lines: List[str] = []
+        recent = messages[-self.max_history:] if self.max_history > 0 else []
+        header = "\n\nContexto de la conversación:\n\n"
+        summary_line = ""
+        if (recent or summary) and remaining > count(header):
+            remaining -= count(header)
+            if summary:
+                summary_line = f"Resumen de la conversación anterior: {summary}"
+                cost = count(summary_line) + 1
+                if cost > remaining:
+                    summary_line = self._counter.truncate(summary_line, remaining - 1)
+                    cost = count(summary_line) + 1
+                    truncated = True
+                remaining -= cost
+            for msg in reversed(recent):
+                line = f"{'Usuario' if msg['role'] == 'user' else 'Asistente'}: {msg['content']}"
+                cost = count(line) + 1
+                if cost > remaining:
+                    truncated = True
+                    break
+                lines.append(line)
+                remaining -= cost
+        elif recent or summary:
+            truncated = True
+        lines.reverse()
+        if summary_line:
+            lines.insert(0, summary_line)
+
+        conversation_context = ""
+        if lines:
+            conversation_context = "\n".join(lines)
+            conversation_context = f"\n\nContexto de la conversación:\n{conversation_context}\n"
+
+        context = "\n\n".join(context_parts)
+        text = (
+            f"{system_prompt}\n\n"
+            f"Contexto de la base de conocimiento:\n{context}\n\n"
+            f"{conversation_context}"
+            f"Pregunta actual del usuario: {question}\n\n"
+            f"{INSTRUCTIONS}"
+        )
+        tokens = count(text)
+        if tokens > self.budget:
+            # Las partes se cuentan por separado; el texto unido no debería superar su suma
+            raise ValueError(f"Prompt de {tokens} tokens por encima del presupuesto de {self.budget}")
+        return BuiltPrompt(
+            text=text,
+            tokens=tokens,
+            budget=self.budget,
+            chunks_used=chunks_used,
+            chunks_dropped=len(chunks) - chunks_used,
+            history_used=len(lines) - (1 if summary_line else 0),
+            truncated=truncated,
+        )
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from app.services.vector_index import normalize_rows
+
+class SemanticAnswerCache:
+    """Respuestas recientes indexadas por el embedding de su pregunta.
+
+    Una pregunta nueva reutiliza una respuesta guardada si comparte ``scope``
+    (mismos chunks recuperados, configuración, historial y corpus) y la
+    similitud coseno entre preguntas supera ``threshold``. Los vectores viven
+    en una matriz float32 preasignada de ``maxsize`` filas normalizadas que
+    funciona como anillo: al llenarse se reemplaza la entrada más antigua.
+    """
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.95, ttl: Optional[float] = None) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize debe ser mayor que 0")
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._matrix: Optional[np.ndarray] = None
+        self._values: List[Any] = [None] * maxsize
+        self._scopes: List[Optional[str]] = [None] * maxsize
+        self._expires: List[float] = [0.0] * maxsize
+        # scope -> filas ocupadas: sólo se compara contra preguntas con los mismos chunks
+        self._by_scope: Dict[str, set] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, vector: Sequence[float]) -> np.ndarray:
+        return normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+
+    def _drop(self, row: int) -> None:
+        scope = self._scopes[row]
+        if scope is not None:
+            rows = self._by_scope[scope]
+            rows.discard(row)
+            if not rows:
+                del self._by_scope[scope]
+        self._scopes[row] = None
+        self._values[row] = None
+
+    def get(self, vector: Sequence[float], scope: str) -> Any:
+        """Valor de la pregunta más parecida dentro de ``scope``, o None si ninguna supera el umbral."""
+        query = self._normalize(vector)
+        with self._lock:
+            rows = self._by_scope.get(scope)
+            if not rows or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            now = time.monotonic()
+            for row in [r for r in rows if self.ttl and self._expires[r] <= now]:
+                self._drop(row)
+            candidates = sorted(self._by_scope.get(scope, ()))
+            if candidates:
+                scores = self._matrix[candidates] @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._values[candidates[best]]
+            self.misses += 1
+            return None
+
+    def set(self, vector: Sequence[float], scope: str, value: Any) -> None:
+        query = self._normalize(vector)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                # Primera entrada (o cambio de modelo de embeddings): se dimensiona la matriz
+                self._matrix = np.zeros((self.maxsize, query.shape[0]), dtype=np.float32)
+                self._by_scope.clear()
+                self._scopes = [None] * self.maxsize
+                self._values = [None] * self.maxsize
+            row = self._next
+            self._next = (row + 1) % self.maxsize
+            self._drop(row)
+            self._matrix[row] = query
+            self._values[row] = value
+            self._scopes[row] = scope
+            self._expires[row] = time.monotonic() + self.ttl if self.ttl else 0.0
+            self._by_scope.setdefault(scope, set()).add(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_scope.clear()
+            self._scopes = [None] * self.maxsize
+            self._values = [None] * self.maxsize
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._by_scope.values())
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
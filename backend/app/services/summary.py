@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+from app.database import ChatMessage, AsyncSessionLocal
+from app.services.history import ChatHistoryService
+from app.services.llm import LLMService
+from app.services.prompt_builder import TokenCounter, aget_token_counter, prompt_budget
+
+class ConversationSummarizer:
+    """Mantiene un resumen acumulado por sesión de los mensajes que salen de la ventana reciente.
+
+    Tras cada turno se pliegan en el resumen sólo los mensajes nuevos que ya
+    no están entre los ``recent`` últimos, así el prompt lleva resumen +
+    mensajes recientes sin solaparse y cada actualización cuesta lo mismo sin
+    importar lo larga que sea la sesión.
+
+    Lo pendiente se pliega por tandas que caben en el presupuesto de tokens del
+    modelo (``prompt_budget``): una sesión larga que aún no tiene resumen
+    necesita varias llamadas, cada una con el resumen de la anterior.
+    """
+    def __init__(
+        self,
+        llm: LLMService,
+        recent: int = 6,
+        max_words: int = 200,
+        max_prompt_tokens: int = 0,
+        session_factory=AsyncSessionLocal,
+    ) -> None:
+        self._llm = llm
+        self._session_factory = session_factory
+        self.recent = recent
+        self.max_words = max_words
+        self.max_prompt_tokens = max_prompt_tokens
+
+    @staticmethod
+    def _line(msg: ChatMessage) -> str:
+        return f"{'Usuario' if msg.role == 'user' else 'Asistente'}: {msg.content}"
+
+    def build_prompt(self, summary: Optional[str], messages: List[ChatMessage]) -> str:
+        return self._prompt(summary, [self._line(msg) for msg in messages])
+
+    def _prompt(self, summary: Optional[str], lines: List[str]) -> str:
+        messages = "\n".join(lines)
+        return (
+            "Actualiza el resumen de una conversación entre un usuario y un asistente.\n\n"
+            f"Resumen actual:\n{summary or '(vacío)'}\n\n"
+            f"Mensajes nuevos:\n{messages}\n\n"
+            f"Devuelve sólo el resumen actualizado, en un máximo de {self.max_words} palabras, "
+            "conservando nombres, datos y preferencias del usuario que puedan necesitarse más adelante."
+        )
+
+    def _next_batch(self, counter: TokenCounter, budget: int, summary: Optional[str], messages: List[ChatMessage]) -> List[str]:
+        """Líneas de los primeros mensajes que caben en ``budget`` junto al resumen actual.
+
+        Siempre incluye al menos un mensaje; si él solo no cabe, se recorta.
+        """
+        room = budget - counter.count(self._prompt(summary, []))
+        lines: List[str] = []
+        for msg in messages:
+            line = self._line(msg)
+            # +1 por el salto de línea que las separa
+            cost = counter.count(line) + 1
+            if cost > room:
+                if not lines:
+                    lines.append(counter.truncate(line, max(room - 1, 1)))
+                break
+            lines.append(line)
+            room -= cost
+        return lines
+
+    async def _pending(self, session_id: int) -> Tuple[Optional[str], Optional[int], List[ChatMessage]]:
+        """(resumen actual, último mensaje resumido, mensajes a plegar)."""
+        async with self._session_factory() as db:
+            service = ChatHistoryService(db)
+            session = await service.get_session(session_id)
+            if session is None:
+                return None, None, []
+            newer = await service.get_messages_after(session_id, session.summary_message_id)
+            to_fold = newer[:-self.recent] if self.recent > 0 else newer
+            return session.summary, session.summary_message_id, to_fold
+
+    async def _save(self, session_id: int, summary: str, last_message_id: int, previous_message_id: Optional[int]) -> bool:
+        async with self._session_factory() as db:
+            return await ChatHistoryService(db).save_summary(session_id, summary, last_message_id, previous_message_id)
+
+    async def update(self, session_id: int, user_settings: Optional[dict] = None) -> bool:
+        """Pliega los mensajes pendientes en el resumen; pensado para ejecutarse en segundo plano.
+
+        Cada tanda se guarda al terminarla, así un fallo a mitad de una sesión
+        larga no obliga a repetir lo ya plegado.
+        """
+        try:
+            summary, previous_id, to_fold = await self._pending(session_id)
+            if not to_fold:
+                return False
+            model, _, max_tokens = self._llm.params(user_settings)
+            counter = await aget_token_counter(model)
+            budget = prompt_budget(model, max_tokens, self.max_prompt_tokens)
+            while to_fold:
+                lines = self._next_batch(counter, budget, summary, to_fold)
+                summary = (await self._llm.aask(self._prompt(summary, lines), user_settings)).strip()
+                last_id = to_fold[len(lines) - 1].id
+                if not await self._save(session_id, summary, last_id, previous_id):
+                    # Otra actualización de la sesión se adelantó: ella sigue desde su resumen
+                    return False
+                previous_id, to_fold = last_id, to_fold[len(lines):]
+            return True
+        except Exception as e:
+            # El resumen es una optimización: un fallo no debe afectar a la conversación
+            print(f"Error actualizando el resumen de la sesión {session_id}: {e}")
+            return False
@@ -1,39 +1,40 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from app.database import UserSettings
 
 class UserSettingsService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def get_user_settings(self, user_id: int) -> Optional[UserSettings]:
+    async def get_user_settings(self, user_id: int) -> Optional[UserSettings]:
         """Obtener configuración del usuario"""
-        return self.db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
+        return await self.db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
     
-    def create_or_update_user_settings(self, user_id: int, settings_data: dict) -> UserSettings:
+    async def create_or_update_user_settings(self, user_id: int, settings_data: dict) -> UserSettings:
         """Crear o actualizar configuración del usuario"""
         # Buscar configuración existente
-        existing_settings = self.get_user_settings(user_id)
+        existing_settings = await self.get_user_settings(user_id)
         
         if existing_settings:
             # Actualizar configuración existente
             for key, value in settings_data.items():
                 if hasattr(existing_settings, key):
                     setattr(existing_settings, key, value)
-            self.db.commit()
-            self.db.refresh(existing_settings)
+            await self.db.commit()
+            await self.db.refresh(existing_settings)
             return existing_settings
         else:
             # Crear nueva configuración
             new_settings = UserSettings(user_id=user_id, **settings_data)
             self.db.add(new_settings)
-            self.db.commit()
-            self.db.refresh(new_settings)
+            await self.db.commit()
+            await self.db.refresh(new_settings)
             return new_settings
     
-    def get_user_settings_dict(self, user_id: int) -> dict:
+    async def get_user_settings_dict(self, user_id: int) -> dict:
         """Obtener configuración del usuario como diccionario"""
-        settings = self.get_user_settings(user_id)
+        settings = await self.get_user_settings(user_id)
         if settings:
             return {
                 "openai_api_key": settings.openai_api_key,
@@ -0,0 +1,348 @@
+import mmap
+from typing import Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma 1 (las filas nulas se dejan en cero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def is_memmap(array: np.ndarray) -> bool:
+    """True si el array, o alguna vista de la que proviene, está mapeado desde disco.
+
+    ``np.asarray`` devuelve una vista ``ndarray`` de un ``np.memmap``, así que
+    no basta con ``isinstance``: se recorre la cadena de ``base``.
+    """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+# Tipos de almacenamiento soportados para la matriz del índice
+INDEX_DTYPES = ("float32", "float16", "int8")
+
+# Valor float32 de cada uno de los 65536 patrones de bits float16: numpy convierte float16 por software y
+# una consulta a la tabla (256 KB, cabe en caché) es más rápida que ``astype``
+_FLOAT16_TABLE = np.arange(1 << 16, dtype=np.uint32).astype(np.uint16).view(np.float16).astype(np.float32)
+
+class VectorIndex:
+    """Índice exacto en memoria: todos los vectores en una sola matriz normalizada.
+
+    Una consulta se resuelve con un único producto matriz‑vector y el top‑k se
+    obtiene por selección parcial (``argpartition``) en lugar de ordenar todo.
+
+    La matriz puede guardarse en float32, float16 o int8 con una escala por
+    vector (2x y 4x menos memoria) y, para modelos Matryoshka como
+    text-embedding-3, truncada a las primeras ``truncate_dim`` dimensiones
+    (renormalizadas). Con ``rescore > 0`` se recalcula de forma exacta, con
+    todas las dimensiones en float32, una lista corta de ``k * rescore``
+    candidatos. La matriz completa se toma del snapshot mapeado (vive en la
+    caché de páginas, no en la memoria del proceso) o, si el índice sólo se
+    trunca, se conserva en memoria. Con cuantización en memoria ``rescore``
+    se ignora avisando: la copia float32 anularía el ahorro.
+    """
+    _block = 16384
+    # Bytes float32 de cada bloque convertido al puntuar una matriz cuantizada (pensado para la caché L2)
+    _score_block_bytes = 256 * 1024
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        normalized: bool = False,
+        dtype: str = "float32",
+        rescore: int = 0,
+        truncate_dim: Optional[int] = None,
+    ) -> None:
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"Tipo de almacenamiento desconocido: {dtype}")
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("La matriz de vectores no coincide con la lista de ids")
+        if not normalized:
+            matrix = normalize_rows(matrix)
+        # Un array de numpy (p.e. tabla de ids de un snapshot) se conserva tal cual
+        self._ids = ids if isinstance(ids, np.ndarray) else list(ids)
+        self.dtype = dtype
+        self.rescore = rescore
+        self.truncate_dim = truncate_dim if truncate_dim and truncate_dim < matrix.shape[1] else None
+        self._dim = matrix.shape[1]
+        stored = matrix
+        if self.truncate_dim:
+            stored = normalize_rows(np.asarray(matrix[:, :self.truncate_dim], dtype=np.float32))
+        self._matrix, self._scales = self._quantize(stored, dtype)
+        lossy = dtype != "float32" or self.truncate_dim is not None
+        keep_exact = bool(rescore) and lossy and (dtype == "float32" or is_memmap(matrix))
+        if rescore and lossy and not keep_exact:
+            print(f"index_rescore ignorado: el índice {dtype} se construyó en memoria, no desde un snapshot")
+        self._exact = matrix if keep_exact else None
+
+    @classmethod
+    def from_vectors(cls, items: Iterable[Tuple[str, List[float]]], dim: Optional[int] = None) -> "VectorIndex":
+        """Construye el índice desde pares (id, vector).
+
+        Con ``dim`` menor que la de los vectores guardados (``embedding_dimension``
+        reducida con text-embedding-3) se truncan a las primeras ``dim``
+        dimensiones y se renormalizan, igual que hace la API con ``dimensions``.
+        Los vectores más cortos se descartan avisando; si no queda ninguno es un
+        error de configuración y se lanza ``ValueError``.
+        """
+        ids: List[str] = []
+        rows: List[List[float]] = []
+        short = 0
+        for chunk_id, vector in items:
+            if not vector:
+                continue
+            if dim is not None:
+                if len(vector) < dim:
+                    short += 1
+                    continue
+                vector = vector[:dim]
+            ids.append(chunk_id)
+            rows.append(vector)
+        if short:
+            if not rows:
+                raise ValueError(
+                    f"Ningún vector del corpus tiene al menos {dim} dimensiones ({short} descartados): "
+                    "revisa embedding_model_name y embedding_dimension"
+                )
+            print(f"Índice vectorial: {short} vectores con menos de {dim} dimensiones descartados")
+        width = dim if dim is not None else (len(rows[0]) if rows else 0)
+        matrix = np.array(rows, dtype=np.float32).reshape(len(rows), width)
+        return cls(ids, matrix)
+
+    @classmethod
+    def from_index(cls, base: "VectorIndex", **params) -> "VectorIndex":
+        """Crea otro índice sobre la matriz float32 de ``base`` sin copiarla."""
+        return cls(base.ids, base.matrix, normalized=True, **params)
+
+    @classmethod
+    def _quantize(cls, matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if dtype == "float32":
+            return matrix, None
+        out = np.empty(matrix.shape, dtype=np.float16 if dtype == "float16" else np.int8)
+        scales = np.ones(matrix.shape[0], dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, matrix.shape[0], cls._block):
+            block = np.asarray(matrix[start:start + cls._block], dtype=np.float32)
+            if dtype == "float16":
+                out[start:start + len(block)] = block
+            else:
+                # Escala por vector: el mayor componente en valor absoluto se mapea a 127
+                scale = np.abs(block).max(axis=1) / 127.0
+                scale[scale == 0] = 1.0
+                out[start:start + len(block)] = np.round(block / scale[:, None])
+                scales[start:start + len(block)] = scale
+        return out, scales
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """Filas en float32 (``rows`` puede ser un slice o un array de posiciones)."""
+        block = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[rows][:, None]
+        return block
+
+    def _similarities(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similitud coseno de la consulta con todas las filas (o con ``rows``).
+
+        Una matriz cuantizada se convierte a float32 por bloques pequeños sobre
+        un único buffer reutilizado, de modo que cada bloque se puntúa mientras
+        sigue en caché y no se reserva memoria por bloque.
+        """
+        if self.dtype == "float32":
+            return (self._matrix if rows is None else self._matrix[rows]) @ q
+        count = len(self) if rows is None else len(rows)
+        width = self._matrix.shape[1]
+        step = max(1, self._score_block_bytes // (4 * width))
+        out = np.empty(count, dtype=np.float32)
+        buffer = np.empty((min(step, count), width), dtype=np.float32)
+        q = np.ascontiguousarray(q, dtype=np.float32)
+        for start in range(0, count, step):
+            part = slice(start, start + step) if rows is None else rows[start:start + step]
+            stored = self._matrix[part]
+            block = buffer[:len(stored)]
+            if self.dtype == "float16":
+                np.take(_FLOAT16_TABLE, stored.view(np.uint16), out=block)
+            else:
+                np.copyto(block, stored, casting="unsafe")
+            np.dot(block, q, out=out[start:start + len(block)])
+            if self._scales is not None:
+                out[start:start + len(block)] *= self._scales[part]
+        return out
+
+    @property
+    def ids(self) -> Sequence[str]:
+        return self._ids
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Matriz float32 normalizada; si sólo se guarda la versión truncada o cuantizada, su reconstrucción."""
+        if self._exact is not None:
+            return self._exact
+        if self.dtype == "float32":
+            return self._matrix
+        return self._dequantize(slice(None))
+
+    @property
+    def dim(self) -> int:
+        """Dimensión de los vectores de entrada (y de las consultas)."""
+        return self._dim
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria privada del índice (un mmap de snapshot no cuenta: es caché de páginas)."""
+        total = sum(m.nbytes for m in (self._matrix, self._exact) if m is not None and not is_memmap(m))
+        if self._scales is not None:
+            total += self._scales.nbytes
+        return total
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _prepare_query(self, query: Sequence[float]) -> np.ndarray:
+        q = np.asarray(query, dtype=np.float32)
+        if q.shape != (self.dim,):
+            raise ValueError(f"La consulta tiene dimensión {q.shape}, se esperaba ({self.dim},)")
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    def _project(self, q: np.ndarray) -> np.ndarray:
+        """Consulta en el espacio almacenado (truncada y renormalizada si aplica)."""
+        if not self.truncate_dim:
+            return q
+        q = q[:self.truncate_dim]
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+        """Posiciones de las k distancias menores, ordenadas de menor a mayor."""
+        if k < len(distances):
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(len(distances))
+        return candidates[np.argsort(distances[candidates], kind="stable")]
+
+    def _select(
+        self,
+        q: np.ndarray,
+        rows: Optional[np.ndarray],
+        distances: np.ndarray,
+        k: int,
+        max_distance: Optional[float],
+    ) -> List[Tuple[str, float]]:
+        """Top‑k final sobre los candidatos (``rows`` None = todas las filas), con re‑puntuación exacta opcional.
+
+        ``q`` es la consulta completa: la re‑puntuación usa todas las dimensiones.
+        """
+        if self._exact is not None:
+            shortlist = self._top_k(distances, k * self.rescore)
+            rows = np.sort(shortlist if rows is None else rows[shortlist])
+            distances = 1.0 - np.asarray(self._exact[rows], dtype=np.float32) @ q
+        top = self._top_k(distances, k)
+        positions = top if rows is None else rows[top]
+        return [
+            (str(self._ids[row]), float(distances[i]))
+            for row, i in zip(positions, top)
+            if max_distance is None or distances[i] <= max_distance
+        ]
+
+    def search(self, query: Sequence[float], k: int, max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Devuelve hasta k pares (id, distancia coseno) ordenados por relevancia.
+
+        Args:
+            query: Vector de la consulta (no necesita estar normalizado)
+            k: Número máximo de resultados
+            max_distance: Si se indica, descarta resultados con distancia mayor
+        """
+        if k <= 0 or len(self._ids) == 0:
+            return []
+        q = self._prepare_query(query)
+        distances = 1.0 - self._similarities(self._project(q))
+        return self._select(q, None, distances, k, max_distance)
+
+class IVFIndex(VectorIndex):
+    """Índice aproximado IVF (inverted file) en NumPy puro.
+
+    Los vectores se agrupan con k‑means esférico en ``n_lists`` listas; cada
+    consulta sólo puntúa los vectores de las ``n_probe`` listas cuyo centroide
+    es más cercano. Más ``n_probe`` = más recall y más latencia.
+    """
+    def __init__(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        normalized: bool = False,
+        dtype: str = "float32",
+        rescore: int = 0,
+        truncate_dim: Optional[int] = None,
+        n_lists: int = 0,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        train_size: int = 0,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(ids, vectors, normalized=normalized, dtype=dtype, rescore=rescore, truncate_dim=truncate_dim)
+        n = len(self)
+        # Regla habitual: ~sqrt(N) listas
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n)))) if n else 1
+        self.n_probe = n_probe
+        rng = np.random.default_rng(seed)
+        self._centroids = self._train(rng, n_iter, train_size or self.n_lists * 64)
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, self._block):
+            block = slice(start, start + self._block)
+            assignments[block] = self._assign(self._dequantize(block))
+        # Listas invertidas en formato CSR: filas ordenadas por lista + offsets
+        self._order = np.argsort(assignments, kind="stable")
+        self._offsets = np.searchsorted(assignments[self._order], np.arange(self.n_lists + 1))
+
+    def _assign(self, matrix: np.ndarray) -> np.ndarray:
+        """Lista (centroide más cercano) de cada fila, por bloques para acotar memoria."""
+        out = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], self._block):
+            out[start:start + self._block] = np.argmax(matrix[start:start + self._block] @ self._centroids.T, axis=1)
+        return out
+
+    def _train(self, rng: np.random.Generator, n_iter: int, train_size: int) -> np.ndarray:
+        n = len(self)
+        if n == 0:
+            return np.zeros((1, self._matrix.shape[1]), dtype=np.float32)
+        sample_rows = np.sort(rng.choice(n, size=min(n, train_size), replace=False))
+        sample = self._dequantize(sample_rows)
+        self._centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self._centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=self.n_lists)
+            empty = counts == 0
+            # Las listas vacías se reinician con un vector aleatorio de la muestra
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            self._centroids = normalize_rows(sums)
+        return self._centroids
+
+    def search(self, query: Sequence[float], k: int, max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        if k <= 0 or len(self._ids) == 0:
+            return []
+        q = self._prepare_query(query)
+        projected = self._project(q)
+        n_probe = min(self.n_probe, self.n_lists)
+        lists = np.argpartition(-(self._centroids @ projected), n_probe - 1)[:n_probe]
+        rows = np.concatenate([self._order[self._offsets[l]:self._offsets[l + 1]] for l in lists])
+        if rows.size == 0:
+            return []
+        rows.sort()  # acceso secuencial a la matriz (importante con mmap)
+        distances = 1.0 - self._similarities(projected, rows)
+        return self._select(q, rows, distances, k, max_distance)
+
+def build_index(base: VectorIndex, kind: str = "exact", **params) -> VectorIndex:
+    """Envuelve un índice exacto float32 con la estructura de búsqueda y el almacenamiento configurados."""
+    if kind == "exact":
+        if params.get("dtype", "float32") == "float32" and not params.get("truncate_dim"):
+            return base
+        return VectorIndex.from_index(base, **params)
+    if kind == "ivf":
+        return IVFIndex.from_index(base, **params)
+    raise ValueError(f"Tipo de índice desconocido: {kind}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escrituras concurrentes en el historial de chat (SQLite).
+
+Varias corrutinas, cada una con su sesión asíncrona de BD, guardan pares
+pregunta/respuesta con ChatHistoryService como peticiones simultáneas de
+/chat-history, contra una base temporal con la configuración por defecto de
+SQLite y con los pragmas de la aplicación.
+
+Uso:
+    python benchmark_history_writes.py --writers 16 --messages 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.database import Base, create_async_session_factory, create_async_sqlite_engine
+from app.services.history import ChatHistoryService
+
+async def run(engine, writers: int, messages: int, sessions: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = create_async_session_factory(engine)
+    async with factory() as db:
+        history = ChatHistoryService(db)
+        session_ids = [(await history.create_session(f"bench {i}", user_id=1)).id for i in range(sessions)]
+
+    latencies, errors = [], []
+
+    async def writer(n: int):
+        async with factory() as db:
+            history = ChatHistoryService(db)
+            for i in range(messages):
+                session_id = session_ids[(n + i) % len(session_ids)]
+                start = time.perf_counter()
+                try:
+                    await history.add_message(session_id, "user", f"pregunta {n}-{i}")
+                    await history.add_message(session_id, "assistant", f"respuesta {n}-{i} " + "x" * 500)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    await db.rollback()
+                    errors.append(type(e).__name__)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(n) for n in range(writers)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return latencies, errors, elapsed
+
+def report(name: str, latencies, errors, elapsed: float):
+    ms = sorted(l * 1000 for l in latencies)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))] if ms else float("nan")
+    print(
+        f"{name:>8}: {len(ms) * 2 / elapsed:8.1f} mensajes/s | "
+        f"p50 {statistics.median(ms) if ms else float('nan'):7.2f} ms | p99 {p99:7.2f} ms | "
+        f"errores {len(errors)}"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escrituras concurrentes del historial")
+    parser.add_argument("--writers", type=int, default=16, help="Peticiones concurrentes (una sesión de BD cada una)")
+    parser.add_argument("--messages", type=int, default=200, help="Pares pregunta/respuesta por petición")
+    parser.add_argument("--sessions", type=int, default=8, help="Sesiones de chat entre las que se reparten")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Por defecto: journal DELETE, synchronous=FULL y el timeout de 5 s del módulo sqlite3
+        default = create_async_engine(f"sqlite+aiosqlite:///{tmp}/default.db")
+        report("default", *await run(default, args.writers, args.messages, args.sessions))
+        tuned = create_async_sqlite_engine(f"sqlite+aiosqlite:///{tmp}/tuned.db")
+        report("pragmas", *await run(tuned, args.writers, args.messages, args.sessions))
+
+if __name__ == "__main__":
+    asyncio.run(main())
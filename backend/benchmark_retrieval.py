@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark de recuperación: latencia y recall@k de los índices frente a la búsqueda exacta.
+
+Uso:
+    python benchmark_retrieval.py --n 200000 --dim 256
+    python benchmark_retrieval.py --snapshot ./vector_snapshot
+"""
+import argparse
+import sys
+import os
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.vector_index import VectorIndex, IVFIndex, build_index
+
+def synthetic_corpus(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Vectores agrupados en temas, parecido a un corpus real de embeddings."""
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+
+def measure(index: VectorIndex, queries: np.ndarray, k: int):
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        results.append([chunk_id for chunk_id, _ in index.search(q, k)])
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, elapsed_ms
+
+def recall_at_k(truth, found) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / sum(len(t) for t in truth)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de índices vectoriales")
+    parser.add_argument("--n", type=int, default=100000, help="Vectores sintéticos")
+    parser.add_argument("--dim", type=int, default=256, help="Dimensión sintética")
+    parser.add_argument("--snapshot", help="Usar un snapshot exportado en lugar de datos sintéticos")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=0, help="Listas IVF (0 = sqrt(N))")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--rescore", type=int, default=4, help="Multiplicador de la lista corta re‑puntuada")
+    parser.add_argument("--truncate", type=int, nargs="+", help="Dimensiones de truncado (por defecto dim/4 y dim/2)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    if args.snapshot:
+        from app.repositories.vector_snapshot import open_snapshot
+        exact = open_snapshot(args.snapshot).index()
+    else:
+        vectors = synthetic_corpus(args.n, args.dim, clusters=max(16, args.n // 1000), rng=rng)
+        exact = VectorIndex([str(i) for i in range(args.n)], vectors)
+    print(f"Corpus: {len(exact)} vectores de dimensión {exact.dim}")
+
+    # Consultas: vectores del corpus con ruido, como preguntas sobre temas existentes
+    rows = rng.choice(len(exact), size=args.queries, replace=False)
+    queries = np.asarray(exact.matrix[rows]) + 0.3 * rng.normal(size=(args.queries, exact.dim)).astype(np.float32) / np.sqrt(exact.dim)
+
+    truth, exact_ms = measure(exact, queries, args.k)
+    print(f"{'índice':<32}{'latencia (ms)':>15}{f'recall@{args.k}':>12}{'memoria (MB)':>14}")
+
+    def report(name: str, index: VectorIndex, ms: float, recall: float) -> None:
+        print(f"{name:<32}{ms:>15.2f}{recall:>12.3f}{index.nbytes / 2**20:>14.1f}")
+
+    report("exact float32", exact, exact_ms, 1.0)
+
+    # Cuantizado, la re‑puntuación float32 sólo se aplica sobre un snapshot mapeado (--snapshot)
+    rescores = (0, args.rescore) if args.snapshot else (0,)
+
+    # Almacenamiento cuantizado, con y sin re‑puntuación float32 de una lista corta
+    for dtype in ("float16", "int8"):
+        for rescore in rescores:
+            index = build_index(exact, dtype=dtype, rescore=rescore)
+            found, ms = measure(index, queries, args.k)
+            name = f"exact {dtype}" + (f" rescore={rescore}" if rescore else "")
+            report(name, index, ms, recall_at_k(truth, found))
+
+    # Truncado Matryoshka: sólo es representativo con embeddings reales (--snapshot);
+    # en los datos sintéticos la información está repartida en todas las dimensiones
+    for dim in args.truncate or [exact.dim // 4, exact.dim // 2]:
+        for rescore in (0, args.rescore):
+            index = build_index(exact, truncate_dim=dim, rescore=rescore)
+            found, ms = measure(index, queries, args.k)
+            name = f"exact dim={dim}" + (f" rescore={rescore}" if rescore else "")
+            report(name, index, ms, recall_at_k(truth, found))
+
+    start = time.perf_counter()
+    ivf = IVFIndex.from_index(exact, n_lists=args.n_lists)
+    print(f"(entrenamiento IVF con {ivf.n_lists} listas: {time.perf_counter() - start:.1f}s)")
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        found, ms = measure(ivf, queries, args.k)
+        report(f"ivf n_probe={n_probe}", ivf, ms, recall_at_k(truth, found))
+
+if __name__ == "__main__":
+    main()
@@ -51,9 +51,10 @@ def debug_retrieval():
     
     # Probar similitudes
     print("\n3. Calculando similitudes:")
+    dim = get_settings().embedding_dim
     scored = []
     for i, chunk in enumerate(chunks):
-        if not chunk.texto or len(chunk.vector) != 1536:
+        if not chunk.texto or len(chunk.vector) != dim:
             print(f"   Chunk {i+1}: SALTADO (texto vacío o vector inválido)")
             continue
         try:
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Exporta los vectores de la colección de Mongo a un snapshot en disco.
+
+Uso:
+    python export_snapshot.py ./vector_snapshot [--keep 2]
+
+Después de exportar, configura ``vector_snapshot_dir`` en el .env
+para que los workers abran el snapshot con mmap en lugar de leer Mongo al arrancar.
+"""
+import argparse
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import get_settings
+from app.repositories.mongo_chunk import MongoChunkRepository
+from app.repositories.vector_snapshot import export_snapshot, open_snapshot, prune_snapshots
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar snapshot vectorial")
+    parser.add_argument("root", help="Directorio raíz de los snapshots")
+    parser.add_argument("--dim", type=int, default=0, help="Dimensión de los vectores (0 = la del modelo)")
+    parser.add_argument("--keep", type=int, default=2, help="Versiones antiguas a conservar")
+    args = parser.parse_args()
+
+    cfg = get_settings()
+    repo = MongoChunkRepository()
+
+    start = time.perf_counter()
+    dim = args.dim or cfg.embedding_dim
+    snapshot = export_snapshot(repo.get_vectors(), args.root, dim=dim, model=cfg.embedding_model_name)
+    print(f"✓ Snapshot {snapshot.version}: {snapshot.meta['count']} vectores en {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    open_snapshot(args.root).index()
+    print(f"✓ Apertura con mmap: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    removed = prune_snapshots(args.root, keep=args.keep)
+    if removed:
+        print(f"Versiones eliminadas: {', '.join(removed)}")
+
+if __name__ == "__main__":
+    main()
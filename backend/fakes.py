@@ -0,0 +1,66 @@
+"""
+Dobles de prueba compartidos por las pruebas de ChatService: repositorio en memoria, embeddings fijos y LLM que cuenta llamadas
+"""
+import asyncio
+from typing import Callable, List, Optional, Sequence, Union
+from app.models.chunk import Chunk
+from app.repositories.base import IChunkRepository
+from app.services.chat import ChatService
+
+class ListRepository(IChunkRepository):
+    """Repositorio en memoria; ``version`` se puede cambiar para simular un corpus nuevo."""
+    version = None
+
+    def __init__(self, chunks: Sequence[Chunk], version: Optional[str] = None):
+        self.chunks = list(chunks)
+        self.version = version
+
+    def get_all(self) -> List[Chunk]:
+        return self.chunks
+
+class FixedEmbeddings:
+    """Devuelve siempre ``vector`` (o ``vector(text)`` si es una función), con ``delay`` opcional en la versión asíncrona."""
+    def __init__(self, vector: Union[List[float], Callable[[str], List[float]]], delay: float = 0.0):
+        self.vector = vector
+        self.delay = delay
+
+    def embed(self, text: str) -> List[float]:
+        return list(self.vector(text) if callable(self.vector) else self.vector)
+
+    async def aembed(self, text: str) -> List[float]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.embed(text)
+
+class CountingLLM:
+    """Cuenta las llamadas y guarda los prompts; responde ``answer`` o, sin él, "respuesta N".
+
+    La temperatura sale de user_settings.
+    """
+    def __init__(self, answer: Optional[str] = None, delay: float = 0.0):
+        self.answer = answer
+        self.delay = delay
+        self.calls = 0
+        self.prompts: List[str] = []
+
+    def params(self, user_settings=None):
+        return "modelo", (user_settings or {}).get("temperature", 0.0), 1000
+
+    def ask(self, prompt, user_settings=None) -> str:
+        self.calls += 1
+        self.prompts.append(prompt)
+        return self.answer or f"respuesta {self.calls}"
+
+    async def aask(self, prompt, user_settings=None) -> str:
+        self.calls += 1
+        self.prompts.append(prompt)
+        answer = self.answer or f"respuesta {self.calls}"
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return answer
+
+def make_chat_service(repo, embeddings, llm, **settings) -> ChatService:
+    """ChatService con la configuración por defecto salvo ``settings`` (p.e. ``embedding_dimension=4``)."""
+    service = ChatService(repo, embeddings, llm)
+    service._cfg = service._cfg.model_copy(update=settings)
+    return service
@@ -0,0 +1,361 @@
+"""
+Pruebas de las cachés en memoria (LRU/TTL) y de la caché de embeddings
+"""
+import time
+from app.core.cache import LRUCache
+from app.models.chunk import Chunk
+from app.services.embedding import EmbeddingService, normalize_query
+from fakes import CountingLLM, FixedEmbeddings, ListRepository, make_chat_service
+
+def test_lru_evicts_least_recently_used():
+    """Al superar maxsize se desaloja la entrada usada hace más tiempo"""
+    evicted = []
+    cache = LRUCache(maxsize=2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert evicted == ["b"]
+    assert cache.stats["evictions"] == 1
+
+def test_ttl_expires_entries():
+    """Las entradas caducadas cuentan como fallo"""
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats["misses"] == 1
+
+def test_expire_idle_entries():
+    """expire(idle) desaloja lo que no se ha usado recientemente"""
+    cache = LRUCache(maxsize=10)
+    cache.set("viejo", 1)
+    time.sleep(0.02)
+    cache.set("nuevo", 2)
+
+    assert cache.expire(idle=0.01) == 1
+    assert "viejo" not in cache and "nuevo" in cache
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+def test_embedding_cache_hits_normalized_queries():
+    """Consultas que sólo difieren en espacios o mayúsculas reutilizan el embedding"""
+    service = EmbeddingService()
+    service._model = CountingModel()
+
+    first = service.embed("¿Qué ver en Quito?")
+    second = service.embed("  ¿qué ver   en QUITO? ")
+
+    assert first == second
+    assert service._model.calls == 1
+    assert service.cache_stats["memory"]["hits"] == 1
+    assert normalize_query(" A  b ") == "a b"
+
+def test_reduced_embedding_dimension_matches_index(monkeypatch):
+    """Con una dimensión no nativa las consultas llegan reducidas y se pueden buscar en el índice"""
+    from app.core.config import get_settings
+
+    class EmbeddingsAPI:
+        """Imita al endpoint de OpenAI: respeta ``dimensions`` y si no devuelve la dimensión nativa."""
+        def create(self, input, model, dimensions=None, **kwargs):
+            return {"data": [{"embedding": [1.0] + [0.0] * ((dimensions or 1536) - 1)} for _ in input]}
+
+    monkeypatch.setenv("embedding_dimension", "256")
+    monkeypatch.setenv("embedding_batch_window_ms", "0")
+    get_settings.cache_clear()
+    try:
+        embeddings = EmbeddingService()
+        embeddings._model.client = EmbeddingsAPI()
+        embeddings._model.check_embedding_ctx_length = False
+        # El corpus se guardó con la dimensión nativa: el índice lo trunca a 256
+        repo = ListRepository([Chunk(_id="1", texto="Quito", vector=[1.0] + [0.0] * 1535)])
+        service = make_chat_service(repo, embeddings, CountingLLM())
+
+        assert len(embeddings.embed("¿Qué ver en Quito?")) == 256
+        assert service.retrieve("¿Qué ver en Quito?").chunks[0].id == "1"
+    finally:
+        get_settings.cache_clear()
+
+def test_disk_cache_is_shared_and_bounded(tmp_path):
+    """La caché en disco se ve desde otra instancia y respeta el tamaño máximo"""
+    from app.services.embedding_cache import SQLiteEmbeddingCache
+
+    path = str(tmp_path / "embeddings.db")
+    writer = SQLiteEmbeddingCache(path, max_entries=2)
+    writer.set("modelo", "uno", [0.5, 1.5])
+    writer.set("modelo", "dos", [1.0, 2.0])
+    writer.set("modelo", "tres", [2.0, 3.0])
+    writer.prune()
+
+    reader = SQLiteEmbeddingCache(path, max_entries=2)
+    assert reader.get("modelo", "tres") == [2.0, 3.0]
+    assert reader.get("otro-modelo", "tres") is None
+    assert len(reader) == 2
+
+def test_disk_cache_close_closes_every_thread(tmp_path):
+    """close() cierra también las conexiones abiertas por otros hilos"""
+    import sqlite3
+    import threading
+    import pytest
+    from app.services.embedding_cache import SQLiteEmbeddingCache
+
+    cache = SQLiteEmbeddingCache(str(tmp_path / "embeddings.db"))
+    opened = []
+    worker = threading.Thread(target=lambda: opened.append(cache._connect()))
+    worker.start()
+    worker.join()
+
+    cache.close()
+
+    for conn in (opened[0], cache._local.conn):
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # Tras cerrar, el hilo que vuelve a usarla abre una conexión nueva
+    cache.set("modelo", "uno", [1.0])
+    assert cache.get("modelo", "uno") == [1.0]
+
+def test_batcher_coalesces_concurrent_queries():
+    """Consultas concurrentes dentro de la ventana viajan en una sola llamada"""
+    import threading
+    from app.services.embedding import EmbeddingBatcher
+
+    model = CountingModel()
+    batcher = EmbeddingBatcher(model.embed_documents, window_ms=50, max_batch=64)
+    results = {}
+
+    def ask(i):
+        results[i] = batcher.embed("x" * (i % 3 + 1))
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert model.calls < 12
+    assert all(results[i] == [float(i % 3 + 1), 1.0] for i in range(12))
+    assert batcher.stats["items"] == 12
+
+def test_mongo_registry_reuses_and_evicts_clients():
+    """Un cliente por URI; al desalojarlo se cierra, pero no mientras está en uso"""
+    from app.repositories.mongo_clients import MongoClientRegistry
+
+    class FakeClient:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    class FakeRegistry(MongoClientRegistry):
+        def _create(self, uri):
+            self.created += 1
+            return FakeClient()
+
+    registry = FakeRegistry(max_clients=1)
+    with registry.client("mongodb://a") as first:
+        with registry.client("mongodb://a") as again:
+            assert again is first
+        with registry.client("mongodb://b") as second:
+            # "a" sale del LRU pero sigue prestado: se cierra al soltarlo
+            assert not first.closed
+        assert registry.stats["retiring"] == 1
+    assert first.closed and not second.closed
+    assert registry.stats["created"] == 2 and registry.stats["in_use"] == 0
+
+    registry.close()
+    assert second.closed and registry.stats["closed"] == 2
+
+def test_mongo_registry_closes_async_clients_on_their_loop():
+    """Un cliente asíncrono desalojado desde otro hilo se cierra en su propio event loop"""
+    import asyncio
+    import threading
+    from app.repositories.mongo_clients import MongoClientRegistry
+
+    class FakeAsyncClient:
+        closed_on = None
+
+        async def close(self):
+            self.closed_on = asyncio.get_running_loop()
+
+    class FakeRegistry(MongoClientRegistry):
+        def _create_async(self, uri):
+            self.created += 1
+            return FakeAsyncClient()
+
+    async def borrow(uri):
+        async with registry.aclient(uri) as client:
+            return client
+
+    registry = FakeRegistry(max_clients=1)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = asyncio.run_coroutine_threadsafe(borrow("mongodb://a"), loop).result()
+        # Desalojo desde otro hilo, como el barrido de inactivos de un repositorio síncrono
+        registry.close()
+        asyncio.run(registry.aclose())
+        assert client.closed_on is loop
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def test_answer_cache_skips_llm_for_identical_prompt():
+    """El mismo prompt no vuelve a llamar al LLM salvo con temperatura > 0 o tras cambiar el corpus"""
+    repo = ListRepository([Chunk(_id="1", texto="Texto", imagenes=["a.jpg"], vector=[0.1] * 4)])
+    llm = CountingLLM()
+    service = make_chat_service(repo, FixedEmbeddings([0.1] * 4), llm, embedding_dimension=4)
+
+    first = service.answer("¿Qué hay?")
+    second = service.answer("¿Qué hay?")
+    assert llm.calls == 1
+    assert second == first and second is not first
+    assert second.images == ["a.jpg"]
+
+    service.answer("¿Qué hay?", user_settings={"temperature": 0.7})
+    service.answer("¿Qué hay?", user_settings={"temperature": 0.7})
+    assert llm.calls == 3
+
+    service.refresh_index()
+    assert service.answer("¿Qué hay?").answer == "respuesta 4"
+
+def test_semantic_cache_matches_similar_questions_in_scope():
+    """Preguntas parecidas reutilizan la respuesta sólo con el mismo scope y por encima del umbral"""
+    from app.services.semantic_cache import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(maxsize=2, threshold=0.95)
+    cache.set([1.0, 0.0, 0.0], "chunks-a", "respuesta a")
+
+    assert cache.get([0.99, 0.05, 0.0], "chunks-a") == "respuesta a"
+    assert cache.get([0.99, 0.05, 0.0], "chunks-b") is None
+    assert cache.get([0.5, 0.5, 0.0], "chunks-a") is None
+
+    # Anillo de tamaño 2: la tercera entrada reemplaza a la más antigua
+    cache.set([0.0, 1.0, 0.0], "chunks-a", "respuesta b")
+    cache.set([0.0, 0.0, 1.0], "chunks-a", "respuesta c")
+    assert cache.get([1.0, 0.0, 0.0], "chunks-a") is None
+    assert len(cache) == 2
+
+def test_chat_service_reuses_answer_for_reworded_question():
+    """Otra redacción con el mismo embedding y los mismos chunks no llama al LLM"""
+    repo = ListRepository([Chunk(_id="1", texto="Quito", vector=[1.0, 0.0, 0.0, 0.0])])
+    # Redacciones distintas dan embeddings casi iguales
+    embeddings = FixedEmbeddings(lambda text: [1.0, 0.01 * len(text), 0.0, 0.0])
+    llm = CountingLLM("La Basílica y el Centro Histórico")
+    service = make_chat_service(repo, embeddings, llm, embedding_dimension=4)
+
+    first = service.answer("¿qué conocer en Quito?")
+    second = service.answer("qué visitar en Quito")
+
+    assert llm.calls == 1
+    assert second.answer == first.answer
+    assert service.answer_cache_stats["semantic"]["hits"] == 1
+
+def test_mongo_repository_version_follows_collection(monkeypatch):
+    """La versión de MongoChunkRepository cambia con altas y bajas y, con el campo indexado, con ediciones"""
+    from contextlib import contextmanager
+    from app.core.config import get_settings
+    from app.repositories.mongo_chunk import MongoChunkRepository
+
+    class FakeCollection:
+        """Lo justo de pymongo para calcular la versión: recuento y el máximo de un campo."""
+        def __init__(self, docs, indexes):
+            self.docs = docs
+            self.indexes = indexes
+            self.sorted_by = []
+
+        def index_information(self):
+            return {f"{field}_-1": {"key": [(field, -1)]} for field in self.indexes}
+
+        def estimated_document_count(self):
+            return len(self.docs)
+
+        def find_one(self, filter, projection, sort):
+            field, _ = sort[0]
+            self.sorted_by.append(field)
+            docs = [doc for doc in self.docs if field in doc]
+            return max(docs, key=lambda doc: doc[field], default=None)
+
+    class FakeRegistry:
+        @contextmanager
+        def client(self, uri):
+            yield {"db": {"chunks": collection}}
+
+    def repository():
+        return MongoChunkRepository(
+            {"mongodb_url": "mongodb://a", "mongodb_db_name": "db", "mongodb_collection_name": "chunks"},
+            clients=FakeRegistry(),
+        )
+
+    # Por defecto sólo recuento y último _id: nunca se ordena por un campo sin índice
+    collection = FakeCollection([{"_id": "1", "updated_at": 10}, {"_id": "2", "updated_at": 20}], ["_id"])
+    repo = repository()
+    before = repo.version
+    collection.docs.append({"_id": "3", "updated_at": 30})
+    assert repo.version != before
+    assert set(collection.sorted_by) == {"_id"}
+
+    monkeypatch.setenv("MONGO_VERSION_FIELD", "updated_at")
+    get_settings.cache_clear()
+    try:
+        # Con el campo configurado pero sin índice se ignora
+        repo = repository()
+        repo.version
+        assert set(collection.sorted_by) == {"_id"}
+
+        collection.indexes.append("updated_at")
+        repo = repository()
+        versions = [repo.version]
+        assert repo.version == versions[0]
+        collection.docs.append({"_id": "4", "updated_at": 35})
+        versions.append(repo.version)
+        collection.docs[0]["updated_at"] = 40
+        versions.append(repo.version)
+        collection.docs.pop(1)
+        versions.append(repo.version)
+        assert len(set(versions)) == 4
+    finally:
+        get_settings.cache_clear()
+
+def test_answer_cache_misses_after_corpus_change():
+    """Al cambiar la versión del corpus la respuesta cacheada deja de servirse sin llamar a refresh_index"""
+    repo = ListRepository([Chunk(_id="1", texto="Texto", vector=[0.1] * 4)], version="v1")
+    llm = CountingLLM()
+    service = make_chat_service(repo, FixedEmbeddings([0.1] * 4), llm, embedding_dimension=4, index_refresh_seconds=0.05)
+
+    assert service.answer("¿Qué hay?").answer == "respuesta 1"
+    assert service.answer("¿Qué hay?").answer == "respuesta 1"
+
+    repo.version = "v2"
+    time.sleep(0.06)
+    assert service.answer("¿Qué hay?").answer == "respuesta 2"
+    assert llm.calls == 2
+
+def test_settings_accept_uppercase_env_names(monkeypatch):
+    """Las variables de entorno en mayúsculas configuran los campos en minúsculas"""
+    from app.core.config import get_settings
+
+    monkeypatch.setenv("ANSWER_CACHE_SIZE", "7")
+    monkeypatch.setenv("answer_cache_ttl", "12.5")
+    get_settings.cache_clear()
+    try:
+        cfg = get_settings()
+        assert cfg.answer_cache_size == 7 and cfg.answer_cache_ttl == 12.5
+        assert cfg.OPENAI_API_KEY is not None
+    finally:
+        get_settings.cache_clear()
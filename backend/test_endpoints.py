@@ -0,0 +1,193 @@
+"""
+Pruebas de los endpoints de chat: formato SSE, guardado tras desconexión y ciclo de vida de los servicios
+"""
+import asyncio
+import json
+from typing import List
+import anyio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.v1 import chat_history
+from app.api.v1.chat import get_chat_service, router as chat_router
+from app.core import container as container_module
+from app.core.container import ServiceContainer, get_container
+from app.core.deps import get_current_active_user
+from app.database import Base, User, create_async_session_factory, create_async_sqlite_engine, get_async_db
+from app.models.chunk import Chunk
+from app.services.chat import ChatService
+from app.services.history import ChatHistoryService
+from fakes import FixedEmbeddings, ListRepository, make_chat_service
+
+CHUNKS = [Chunk(_id="1", texto="Quito", imagenes=["quito.jpg"], vector=[1.0, 0.0, 0.0, 0.0])]
+
+class StreamingLLM:
+    """Emite ``tokens``; con ``hang`` se queda esperando después del primero (cliente que se va)."""
+    def __init__(self, tokens: List[str], hang: bool = False):
+        self.tokens = tokens
+        self.hang = hang
+
+    def params(self, user_settings=None):
+        return "modelo", 0.0, 1000
+
+    async def astream(self, prompt, user_settings=None):
+        for token in self.tokens:
+            yield token
+            if self.hang:
+                await anyio.sleep_forever()
+
+def _chat_service(llm) -> ChatService:
+    return make_chat_service(ListRepository(CHUNKS), FixedEmbeddings([1.0, 0.0, 0.0, 0.0]), llm, embedding_dimension=4)
+
+def _parse_sse(body: str) -> List[tuple]:
+    events = []
+    for block in body.split("\n\n"):
+        if block:
+            event, data = block.split("\n")
+            assert event.startswith("event: ") and data.startswith("data: ")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_chat_stream_sse_framing():
+    """/chat/stream emite media, un evento por fragmento y done con la respuesta completa"""
+    app = FastAPI()
+    app.include_router(chat_router)
+    app.dependency_overrides[get_chat_service] = lambda: _chat_service(StreamingLLM(["Hola", " Quito"]))
+
+    with TestClient(app) as client:
+        response = client.post("/chat/stream", json={"question": "¿Qué ver en Quito?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["media", "token", "token", "done"]
+    assert events[0][1]["images"] == ["quito.jpg"]
+    assert [data["text"] for name, data in events if name == "token"] == ["Hola", " Quito"]
+    assert events[-1][1] == {"answer": "Hola Quito"}
+
+def test_history_stream_saves_partial_answer_after_disconnect(tmp_path, monkeypatch):
+    """Si el cliente se desconecta a mitad del stream la respuesta parcial se guarda igualmente"""
+    class Container:
+        def chat_service(self, user_settings=None):
+            return service
+
+    service = _chat_service(StreamingLLM(["Hola", " Quito"], hang=True))
+
+    async def scenario():
+        engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = create_async_session_factory(engine)
+        monkeypatch.setattr(chat_history, "AsyncSessionLocal", factory)
+
+        async def db_override():
+            async with factory() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(chat_history.router)
+        app.dependency_overrides[get_current_active_user] = lambda: User(id=1, email="a@b.c", username="ana")
+        app.dependency_overrides[get_async_db] = db_override
+        app.dependency_overrides[get_container] = lambda: Container()
+        monkeypatch.setattr(chat_history, "get_settings", lambda: service._cfg.model_copy(update={"history_summary_enabled": False}))
+
+        # ASGI a mano: tras el primer fragmento el cliente se desconecta
+        first_token = anyio.Event()
+        sent = []
+        body = json.dumps({"question": "¿Qué ver en Quito?"}).encode("utf-8")
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await first_token.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and b"event: token" in message.get("body", b""):
+                first_token.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/chat-history/stream", "raw_path": b"/chat-history/stream",
+            "root_path": "", "query_string": b"", "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1), "server": ("test", 80),
+        }
+        with anyio.fail_after(5):
+            await app(scope, receive, send)
+
+        assert not any(b"event: done" in m.get("body", b"") for m in sent)
+        async with factory() as db:
+            messages = await ChatHistoryService(db).get_session_messages(1)
+        await engine.dispose()
+        return [(m.role, m.content) for m in messages]
+
+    assert asyncio.run(scenario()) == [("user", "¿Qué ver en Quito?"), ("assistant", "Hola")]
+
+class ClosingRepository(ListRepository):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+def _patch_repositories(monkeypatch) -> List[ClosingRepository]:
+    """El contenedor crea ClosingRepository en lugar de conectarse a MongoDB; devuelve los creados."""
+    repos = []
+
+    def create_repository(user_settings=None, clients=None):
+        repos.append(ClosingRepository(CHUNKS))
+        return repos[-1]
+
+    monkeypatch.setattr(container_module, "create_chunk_repository", create_repository)
+    return repos
+
+def test_container_evicts_and_closes_tenant_services(monkeypatch):
+    """Cada origen de chunks tiene un servicio; al salir del LRU o al cerrar el contenedor se cierra"""
+    repos = _patch_repositories(monkeypatch)
+    container = ServiceContainer(max_tenants=1)
+
+    first = container.chat_service({"mongodb_url": "mongodb://a"})
+    assert container.chat_service({"mongodb_url": "mongodb://a"}) is first
+    container.chat_service({"mongodb_url": "mongodb://b"})
+    assert len(repos) == 2 and repos[0].closed and not repos[1].closed
+
+    asyncio.run(container.aclose())
+    assert repos[1].closed
+
+def test_container_closes_only_its_own_mongo_clients(monkeypatch):
+    """Cerrar un contenedor no cierra los clientes MongoDB de otro ni los del registro del proceso"""
+    from app.repositories.mongo_clients import get_mongo_registry
+
+    class FakeClient:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    _patch_repositories(monkeypatch)
+    first, second = ServiceContainer(), ServiceContainer()
+    assert first.mongo is not second.mongo and first.mongo is not get_mongo_registry()
+    clients = []
+    for container in (first, second):
+        container.mongo._create = lambda uri: clients.append(FakeClient()) or clients[-1]
+        with container.mongo.client("mongodb://a"):
+            pass
+
+    asyncio.run(first.aclose())
+    assert clients[0].closed and not clients[1].closed
+    second.close()
+    assert clients[1].closed
+
+def test_lifespan_closes_container_on_shutdown(monkeypatch):
+    """El contenedor se crea al arrancar la aplicación y se cierra al apagarla"""
+    monkeypatch.setattr("app.database.create_tables", lambda: None)
+    from app import main
+
+    repos = _patch_repositories(monkeypatch)
+    app = FastAPI(lifespan=main.lifespan)
+
+    with TestClient(app):
+        assert app.state.container.chat_service() is app.state.container.chat_service()
+        assert not repos[0].closed
+    assert repos[0].closed
@@ -0,0 +1,241 @@
+"""
+Pruebas del resumen acumulado de sesiones, del historial asíncrono y de la migración ligera del esquema
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, inspect, text
+from app.database import Base, create_async_session_factory, create_async_sqlite_engine, migrate_schema
+from app.services.history import ChatHistoryService
+from app.services.summary import ConversationSummarizer
+from fakes import CountingLLM
+
+@asynccontextmanager
+async def _session_factory(tmp_path, name="chat.db"):
+    engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{tmp_path / name}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield create_async_session_factory(engine)
+    finally:
+        await engine.dispose()
+
+def test_summary_folds_only_messages_outside_recent_window(tmp_path):
+    """Sólo se resumen los mensajes que ya no entran en la ventana reciente"""
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            session_id = (await history.create_session("viaje", user_id=1)).id
+            for i in range(10):
+                await history.add_message(session_id, "user" if i % 2 == 0 else "assistant", f"mensaje {i}")
+
+            llm = CountingLLM()
+            summarizer = ConversationSummarizer(llm, recent=6, session_factory=factory)
+            assert await summarizer.update(session_id) is True
+            assert "mensaje 3" in llm.prompts[0] and "mensaje 4" not in llm.prompts[0]
+
+            # Sin mensajes nuevos fuera de la ventana no se vuelve a llamar al LLM
+            assert await summarizer.update(session_id) is False
+            assert len(llm.prompts) == 1
+
+            db.expire_all()
+            context = await history.get_conversation_context(await history.get_session(session_id), 6)
+            assert context[0] == {"role": "summary", "content": "respuesta 1"}
+            assert [m["content"] for m in context[1:]] == [f"mensaje {i}" for i in range(4, 10)]
+
+            await history.add_message(session_id, "user", "mensaje 10")
+            await history.add_message(session_id, "assistant", "mensaje 11")
+            assert await summarizer.update(session_id) is True
+            assert "respuesta 1" in llm.prompts[1] and "mensaje 5" in llm.prompts[1] and "mensaje 6" not in llm.prompts[1]
+
+    asyncio.run(scenario())
+
+def test_default_context_keeps_last_ten_messages(tmp_path):
+    """Sin resumen el contexto conserva los 10 últimos mensajes, como antes de los resúmenes"""
+    from app.core.config import get_settings
+
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            session = await history.create_session("viaje", user_id=1)
+            for i in range(12):
+                await history.add_message(session.id, "user", f"mensaje {i}")
+            context = await history.get_conversation_context(session, get_settings().history_recent_messages)
+            return [m["content"] for m in context]
+
+    assert asyncio.run(scenario()) == [f"mensaje {i}" for i in range(2, 12)]
+
+def test_long_backlog_is_folded_in_token_bounded_batches(tmp_path):
+    """Una sesión larga sin resumen se pliega en varias llamadas que respetan el presupuesto de tokens"""
+    from app.services.prompt_builder import get_token_counter
+
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            session_id = (await history.create_session("viaje", user_id=1)).id
+            for i in range(12):
+                await history.add_message(session_id, "user", f"mensaje {i} " + "detalle " * 60)
+            await history.add_message(session_id, "assistant", "enorme " + "palabra " * 2000)
+            await history.add_message(session_id, "user", "último")
+
+            llm = CountingLLM()
+            summarizer = ConversationSummarizer(llm, recent=1, max_prompt_tokens=400, session_factory=factory)
+            assert await summarizer.update(session_id) is True
+
+            counter = get_token_counter("modelo")
+            assert len(llm.prompts) > 2
+            assert all(counter.count(prompt) <= 400 for prompt in llm.prompts)
+            # Cada tanda parte del resumen de la anterior y todos los mensajes se pliegan una vez, en orden
+            for i, prompt in enumerate(llm.prompts[1:], start=1):
+                assert f"respuesta {i}" in prompt
+            folded = [n for n in range(12) for prompt in llm.prompts if f"mensaje {n} " in prompt]
+            assert folded == list(range(12))
+            assert "Asistente: enorme" in llm.prompts[-1] and "último" not in llm.prompts[-1]
+
+            session = await history.get_session(session_id)
+            assert session.summary == f"respuesta {len(llm.prompts)}"
+            assert await summarizer.update(session_id) is False
+
+    asyncio.run(scenario())
+
+def test_migrate_schema_adds_missing_columns(tmp_path):
+    """Una base creada antes de las columnas nuevas las recibe sin perder datos"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE chat_sessions (id INTEGER PRIMARY KEY, user_id INTEGER, title VARCHAR(255) NOT NULL,"
+            " created_at DATETIME, updated_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO chat_sessions (id, title) VALUES (1, 'antigua')"))
+
+    migrate_schema(bind=engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("chat_sessions")}
+    assert {"summary", "summary_message_id"} <= columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT title FROM chat_sessions")).scalar() == "antigua"
+
+def test_keyset_message_pages(tmp_path):
+    """Las páginas de mensajes se leen por keyset sobre el índice (session_id, created_at)"""
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            session = await history.create_session("viaje", user_id=1)
+            other = await history.create_session("otra", user_id=1)
+            ids = [(await history.add_message(session.id, "user", f"mensaje {i}")).id for i in range(7)]
+            await history.add_message(other.id, "user", "ajeno")
+
+            last = await history.get_recent_messages(session.id, 3)
+            assert [m.content for m in last] == ["mensaje 4", "mensaje 5", "mensaje 6"]
+            older = await history.get_recent_messages(session.id, 3, before=(last[0].created_at, last[0].id))
+            assert [m.content for m in older] == ["mensaje 1", "mensaje 2", "mensaje 3"]
+            newer = await history.get_messages_after(session.id, ids[2], limit=2)
+            assert [m.content for m in newer] == ["mensaje 3", "mensaje 4"]
+
+            plan = (await db.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM chat_messages WHERE session_id = 1 ORDER BY created_at DESC LIMIT 3"
+            ))).all()
+            assert any("ix_chat_messages_session_created_at" in row[-1] for row in plan)
+
+    asyncio.run(scenario())
+    indexes = {ix["name"]: ix["column_names"] for ix in inspect(create_engine(f"sqlite:///{tmp_path / 'chat.db'}")).get_indexes("chat_messages")}
+    assert indexes["ix_chat_messages_session_created_at"] == ["session_id", "created_at"]
+
+def test_session_counters_maintained_and_backfilled(tmp_path):
+    """El listado usa contadores desnormalizados, mantenidos al escribir y rellenados al migrar"""
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            session = await history.create_session("viaje", user_id=1)
+            await history.add_message(session.id, "user", "x" * 150)
+            await history.add_message(session.id, "assistant", "respuesta")
+            await history.add_message(session.id, "user", "¿y en Cuenca?")
+            await history.add_message(session.id, "assistant", "otra respuesta")
+
+            listed = await history.get_user_sessions(1)
+            assert [(s.message_count, s.last_user_preview) for s in listed] == [(4, "¿y en Cuenca?")]
+
+            # El borrado en cascada carga los mensajes dentro de la sesión asíncrona
+            assert await history.delete_user_session(1, session.id) is True
+            assert await history.get_user_sessions(1) == []
+            assert await history.get_session_messages(session.id) == []
+
+    asyncio.run(scenario())
+
+    # Base anterior a los contadores: la migración los calcula a partir de los mensajes
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE chat_sessions (id INTEGER PRIMARY KEY, user_id INTEGER, title VARCHAR(255) NOT NULL,"
+            " created_at DATETIME, updated_at DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, session_id INTEGER NOT NULL,"
+            " role VARCHAR(50) NOT NULL, content TEXT NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO chat_sessions (id, title) VALUES (1, 'antigua'), (2, 'vacía')"))
+        conn.execute(text(
+            "INSERT INTO chat_messages (session_id, role, content) VALUES"
+            " (1, 'user', :long), (1, 'assistant', 'hola')"
+        ), {"long": "y" * 150})
+
+    migrate_schema(bind=engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, message_count, last_user_preview FROM chat_sessions ORDER BY id")).all()
+    assert rows == [(1, 2, "y" * 100 + "..."), (2, 0, None)]
+    indexes = {ix["name"] for ix in inspect(engine).get_indexes("chat_sessions")}
+    assert "ix_chat_sessions_user_updated_at" in indexes
+
+def test_session_pages_follow_cursor(tmp_path):
+    """Las páginas de sesiones recorren (updated_at, id) sin repetir ni saltar filas, aun con empates"""
+    from app.core.pagination import decode_cursor, encode_cursor
+
+    async def scenario():
+        async with _session_factory(tmp_path) as factory, factory() as db:
+            history = ChatHistoryService(db)
+            sessions = [await history.create_session(f"sesión {i}", user_id=1) for i in range(5)]
+            await history.create_session("ajena", user_id=2)
+            # Misma marca de tiempo en todas: el id desempata
+            same = sessions[0].updated_at
+            for session in sessions:
+                session.updated_at = same
+            await db.commit()
+
+            seen, position = [], None
+            while True:
+                page = await history.get_user_sessions(1, limit=2, before=position)
+                seen.extend(s.id for s in page)
+                if len(page) < 2:
+                    break
+                position = decode_cursor(encode_cursor(page[-1].updated_at, page[-1].id))
+            assert seen == sorted((s.id for s in sessions), reverse=True)
+
+    asyncio.run(scenario())
+    assert decode_cursor(None) is None
+    try:
+        decode_cursor("no-es-un-cursor")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("cursor inválido aceptado")
+
+def test_sqlite_engine_applies_pragmas(tmp_path):
+    """Cada conexión del engine de la aplicación sale con WAL, busy_timeout y caché configurados"""
+    from app.database import create_sqlite_engine
+
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -64 * 1024
+    engine.dispose()
+
+    async def check_async():
+        async_engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}")
+        async with async_engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar().lower() == "wal"
+        await async_engine.dispose()
+
+    asyncio.run(check_async())
@@ -19,6 +19,9 @@ class MockChunkRepository(IChunkRepository):
 class MockEmbeddingService:
     def embed(self, text: str) -> List[float]:
         return [0.1] * 1536
+
+    async def aembed(self, text: str) -> List[float]:
+        return self.embed(text)
     
     def cosine_distance(self, vec1: List[float], vec2: List[float]) -> float:
         return 0.7  # Dentro del umbral 0.85
@@ -27,6 +30,12 @@ class MockLLMService:
     def ask(self, prompt: str, user_settings=None) -> str:
         return "Respuesta de prueba"
 
+    async def aask(self, prompt: str, user_settings=None) -> str:
+        return self.ask(prompt, user_settings)
+
+    def params(self, user_settings=None):
+        return "modelo-de-prueba", 0.0, 1000
+
 def test_no_images_for_questions_without_media_chunks():
     """Chunks sin multimedia no devuelven imágenes"""
     chunks = [
@@ -93,6 +102,39 @@ def test_images_for_visual_questions():
     assert len(result.images) == 2
     assert len(result.videos) == 1
 
+def test_async_answer_matches_sync():
+    """aanswer arma el mismo prompt y devuelve lo mismo que answer"""
+    import asyncio
+
+    class RecordingLLMService(MockLLMService):
+        def __init__(self):
+            self.prompts = []
+
+        def ask(self, prompt: str, user_settings=None) -> str:
+            self.prompts.append(prompt)
+            return super().ask(prompt, user_settings)
+
+    chunks = [
+        Chunk(
+            id="1",
+            texto="Información turística",
+            imagenes=["imagen1.jpg"],
+            videos=["video1.mp4"],
+            vector=[0.1] * 1536
+        )
+    ]
+    # Servicios independientes: la caché de respuestas de uno no puede contestar por el otro
+    sync_llm, async_llm = RecordingLLMService(), RecordingLLMService()
+    sync_service = ChatService(MockChunkRepository(chunks), MockEmbeddingService(), sync_llm)
+    async_service = ChatService(MockChunkRepository(chunks), MockEmbeddingService(), async_llm)
+
+    expected = sync_service.answer("¿Cuáles son los mejores lugares?")
+    result = asyncio.run(async_service.aanswer("¿Cuáles son los mejores lugares?"))
+
+    assert result == expected
+    assert len(async_llm.prompts) == 1 and async_llm.prompts == sync_llm.prompts
+    assert result.images == ["imagen1.jpg"]
+
 if __name__ == "__main__":
     print("Ejecutando prueba 1: Chunks sin multimedia no devuelven imágenes")
     test_no_images_for_questions_without_media_chunks()
@@ -105,5 +147,9 @@ if __name__ == "__main__":
     print("\nEjecutando prueba 3: Preguntas visuales explícitas devuelven imágenes")
     test_images_for_visual_questions()
     print("✓ Prueba 3 pasó")
+
+    print("\nEjecutando prueba 4: aanswer coincide con answer")
+    test_async_answer_matches_sync()
+    print("✓ Prueba 4 pasó")
     
     print("\nTodas las pruebas completadas exitosamente")
@@ -0,0 +1,103 @@
+"""
+Pruebas del armado del prompt con presupuesto de tokens
+"""
+from app.services.prompt_builder import INSTRUCTIONS, PromptBuilder, TokenCounter, prompt_budget
+
+class WordCounter(TokenCounter):
+    """Un token por palabra: hace las pruebas independientes de tiktoken"""
+    def __init__(self):
+        self.model = "palabras"
+        self._encoding = None
+
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max(max_tokens, 0)])
+
+def test_everything_fits_within_budget():
+    """Con presupuesto holgado entran todos los chunks y el historial"""
+    builder = PromptBuilder(WordCounter(), budget=1000)
+    history = [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "buenas"}]
+
+    built = builder.build("Eres un asistente", "¿Qué ver?", ["uno dos", "tres cuatro"], history)
+
+    assert built.chunks_used == 2 and built.chunks_dropped == 0
+    assert built.history_used == 2 and not built.truncated
+    assert "uno dos\n\ntres cuatro" in built.text
+    assert "Usuario: hola\nAsistente: buenas" in built.text
+    assert built.tokens == WordCounter().count(built.text) <= 1000
+
+def test_chunks_have_priority_over_history():
+    """Sin espacio se recorta el último chunk que cabe y el historial queda fuera"""
+    counter = WordCounter()
+    base = PromptBuilder(counter, budget=10_000).build("Sistema", "pregunta", [], None).tokens
+    builder = PromptBuilder(counter, budget=base + 150, min_chunk_tokens=10)
+    chunks = [" ".join(["a"] * 100), " ".join(["b"] * 100), " ".join(["c"] * 100)]
+
+    built = builder.build("Sistema", "pregunta", chunks, [{"role": "user", "content": "antes"}])
+
+    assert built.truncated
+    assert built.chunks_used == 2 and built.chunks_dropped == 1
+    assert "c" not in built.text.split()
+    assert built.history_used == 0
+    assert built.tokens <= built.budget
+
+def test_history_keeps_most_recent_messages():
+    """El historial se llena desde el mensaje más reciente"""
+    counter = WordCounter()
+    history = [{"role": "user", "content": f"mensaje {i} " + "x " * 20} for i in range(10)]
+    base = PromptBuilder(counter, budget=10_000).build("Sistema", "pregunta", [], None).tokens
+
+    built = PromptBuilder(counter, budget=base + 60).build("Sistema", "pregunta", [], history)
+
+    assert built.history_used == 2
+    assert "mensaje 9" in built.text and "mensaje 8" in built.text and "mensaje 7" not in built.text
+
+def test_question_has_priority_over_long_system_prompt():
+    """Un prompt de sistema largo se recorta antes que la pregunta; sin sitio para la pregunta es un error"""
+    import pytest
+
+    counter = WordCounter()
+    base = PromptBuilder(counter, budget=10_000).build("", "", [], None).tokens
+    system_prompt = " ".join(["regla"] * 300)
+
+    built = PromptBuilder(counter, budget=base + 10).build(system_prompt, "¿qué ver en Quito?", ["uno"], None)
+
+    assert built.truncated and built.tokens <= built.budget
+    assert built.text.rstrip().endswith(INSTRUCTIONS.split()[-1])
+    assert "Pregunta actual del usuario: ¿qué ver en Quito?" in built.text
+    assert built.text.split().count("regla") == 6 and built.chunks_used == 0
+
+    with pytest.raises(ValueError):
+        PromptBuilder(counter, budget=base).build(system_prompt, "¿qué ver en Quito?", [], None)
+
+def test_prompt_budget_per_model():
+    """El presupuesto descuenta la respuesta y respeta el tope configurado"""
+    assert prompt_budget("gpt-4", 1000) == 7192
+    assert prompt_budget("gpt-4o-mini-2024-07-18", 1000, max_prompt_tokens=8000) == 8000
+    assert prompt_budget("modelo-desconocido", 1000) == 7192
+
+def test_async_token_counter_loads_encoding_off_the_event_loop(monkeypatch):
+    """La primera carga de la codificación de un modelo se hace en un hilo; después sale de la caché"""
+    import asyncio
+    import threading
+    from app.services import prompt_builder
+
+    loads = []
+
+    def get_token_counter(model):
+        loads.append(threading.current_thread())
+        return WordCounter()
+
+    monkeypatch.setattr(prompt_builder, "get_token_counter", get_token_counter)
+    monkeypatch.setattr(prompt_builder, "_loaded_models", set())
+
+    async def scenario():
+        await prompt_builder.aget_token_counter("modelo")
+        await prompt_builder.aget_token_counter("modelo")
+
+    asyncio.run(scenario())
+    # Carga en un hilo auxiliar y después dos lecturas de la caché en el hilo del loop
+    assert loads[0] is not threading.main_thread()
+    assert loads[1:] == [threading.main_thread()] * 2
@@ -0,0 +1,168 @@
+"""
+Pruebas de las utilidades de concurrencia de los endpoints de chat (grafo de etapas y singleflight)
+"""
+import asyncio
+import time
+import pytest
+from app.core.stages import StageGraph
+
+def test_independent_stages_run_concurrently():
+    """Las etapas sin dependencia entre sí se solapan y reciben los resultados previos"""
+    async def settings():
+        return {"top_k": 3}
+
+    async def slow(settings):
+        await asyncio.sleep(0.1)
+        return settings["top_k"]
+
+    async def answer(session, retrieval):
+        return session + retrieval
+
+    graph = (
+        StageGraph()
+        .add("settings", settings)
+        .add("session", slow, after=["settings"])
+        .add("retrieval", slow, after=["settings"])
+        .add("answer", answer, after=["session", "retrieval"])
+    )
+    start = time.perf_counter()
+    results = asyncio.run(graph.run())
+
+    assert results["answer"] == 6
+    assert time.perf_counter() - start < 0.19
+    assert set(graph.timings) == {"settings", "session", "retrieval", "answer"}
+
+def test_failing_stage_cancels_the_rest():
+    """Un fallo se propaga y cancela las etapas en curso"""
+    cancelled = []
+
+    async def fail():
+        raise LookupError("sesión no encontrada")
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    graph = StageGraph().add("session", fail).add("retrieval", slow)
+
+    with pytest.raises(LookupError):
+        asyncio.run(graph.run())
+    assert cancelled == [True]
+
+def test_dependencies_must_be_declared_first():
+    with pytest.raises(ValueError):
+        StageGraph().add("answer", lambda retrieval: retrieval, after=["retrieval"])
+
+def test_async_singleflight_coalesces_identical_calls():
+    """Llamadas concurrentes con la misma clave comparten una única ejecución"""
+    from app.core.singleflight import AsyncSingleFlight
+
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key.upper()
+
+    async def main():
+        return await asyncio.gather(*(flight.do(k, lambda k=k: work(k)) for k in ["a"] * 5 + ["b"]))
+
+    assert asyncio.run(main()) == ["A"] * 5 + ["B"]
+    assert sorted(calls) == ["a", "b"]
+    assert flight.stats == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+def test_singleflight_shares_result_across_threads():
+    """Los hilos seguidores reciben el resultado del líder"""
+    import threading
+    from app.core.singleflight import SingleFlight
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def work():
+        started.set()
+        release.wait(1)
+        return "respuesta"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.followers < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert results == ["respuesta"] * 4
+    assert flight.leaders == 1
+
+def test_async_singleflight_follower_takes_over_cancelled_leader():
+    """Si se cancela el líder, una seguidora repite el trabajo y las demás reciben su resultado"""
+    from app.core.singleflight import AsyncSingleFlight
+
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(len(calls))
+            await release.wait()
+            return "respuesta"
+
+        leader = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("k", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(main()) == ["respuesta"] * 3
+    assert calls == [0, 1]
+    assert flight.stats["in_flight"] == 0 and flight.leaders == 2
+
+def test_chat_service_flight_key_covers_question_settings_and_corpus():
+    """Sólo coalescen preguntas equivalentes con la misma configuración y el mismo corpus"""
+    from app.models.chunk import Chunk
+    from fakes import CountingLLM, FixedEmbeddings, ListRepository, make_chat_service
+
+    repo = ListRepository([Chunk(_id="1", texto="Quito", vector=[1.0, 0.0])])
+    llm = CountingLLM("respuesta", delay=0.05)
+    service = make_chat_service(repo, FixedEmbeddings([1.0, 0.0], delay=0.01), llm, embedding_dimension=2)
+    # Sin cachés de respuestas: lo que se comparte es la ejecución en curso
+    service._answers = service._semantic = None
+
+    key = service._answer_key("¿Qué ver en Quito?")
+    assert service._answer_key("  ¿qué ver   en QUITO? ") == key
+    assert service._answer_key("¿Qué ver en Quito?", user_settings={"top_k": 5}) != key
+    assert service._answer_key("¿Qué ver en Quito?", user_settings={"openai_api_key": "sk-otra"}) != key
+    assert service._answer_key("¿Qué ver en Quito?", [{"role": "user", "content": "hola"}]) != key
+
+    async def ask_all():
+        return await asyncio.gather(
+            service.aanswer("¿Qué ver en Quito?"),
+            service.aanswer("¿qué ver en quito?"),
+            service.aanswer("¿Qué ver en Quito?", user_settings={"top_k": 5}),
+        )
+
+    first, second, other = asyncio.run(ask_all())
+    assert first == second == other and first is not second
+    assert llm.calls == 2
+
+    service.refresh_index()
+    assert service._answer_key("¿Qué ver en Quito?") != key
@@ -0,0 +1,200 @@
+"""
+Pruebas del índice vectorial en memoria usado por ChatService
+"""
+import numpy as np
+import pytest
+from app.services.vector_index import VectorIndex
+
+def _brute_force(query, ids, vectors, k):
+    scored = []
+    for chunk_id, vec in zip(ids, vectors):
+        sim = np.dot(query, vec) / (np.linalg.norm(query) * np.linalg.norm(vec))
+        scored.append((1 - float(sim), chunk_id))
+    scored.sort()
+    return [chunk_id for _, chunk_id in scored[:k]]
+
+def test_search_matches_brute_force():
+    """El top-k coincide con el cálculo chunk a chunk"""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    ids = [str(i) for i in range(500)]
+    index = VectorIndex(ids, vectors)
+
+    query = rng.normal(size=64)
+    hits = index.search(query, k=10)
+
+    assert [chunk_id for chunk_id, _ in hits] == _brute_force(query, ids, vectors, 10)
+    distances = [dist for _, dist in hits]
+    assert distances == sorted(distances)
+
+def test_search_respects_max_distance():
+    """Los resultados por encima del umbral se descartan"""
+    index = VectorIndex(["a", "b"], np.array([[1.0, 0.0], [0.0, 1.0]]))
+
+    hits = index.search([1.0, 0.1], k=5, max_distance=0.5)
+
+    assert [chunk_id for chunk_id, _ in hits] == ["a"]
+
+def test_from_vectors_fits_dimensions():
+    """Los vectores más largos se truncan y renormalizan; los más cortos o vacíos no entran al índice"""
+    index = VectorIndex.from_vectors([("a", [1.0, 0.0]), ("b", [1.0]), ("c", []), ("d", [0.0, 3.0, 4.0])], dim=2)
+
+    assert index.ids == ["a", "d"]
+    assert index.search([0.0, 1.0], k=3) == [("d", pytest.approx(0.0)), ("a", pytest.approx(1.0))]
+
+    with pytest.raises(ValueError, match="embedding_dimension"):
+        VectorIndex.from_vectors([("a", [1.0, 0.0])], dim=4)
+
+def test_empty_index_returns_nothing():
+    """Un índice vacío no falla"""
+    index = VectorIndex.from_vectors([], dim=4)
+
+    assert len(index) == 0
+    assert index.search([1.0, 0.0, 0.0, 0.0], k=3) == []
+
+def test_repository_two_phase_defaults():
+    """get_vectors omite chunks sin texto y get_by_ids respeta el orden pedido"""
+    from app.models.chunk import Chunk
+    from fakes import ListRepository
+
+    repo = ListRepository([
+        Chunk(_id="a", texto="uno", vector=[1.0] * 1536),
+        Chunk(_id="b", texto="", vector=[1.0] * 1536),
+        Chunk(_id="c", texto="tres", vector=[0.5] * 1536),
+    ])
+
+    assert [chunk_id for chunk_id, _ in repo.get_vectors()] == ["a", "c"]
+    assert [c.id for c in repo.get_by_ids(["c", "a", "z"])] == ["c", "a"]
+
+def test_snapshot_roundtrip(tmp_path):
+    """Un snapshot exportado se abre con mmap y da los mismos resultados"""
+    from app.repositories.vector_snapshot import export_snapshot, open_snapshot
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(50, 16)).astype(np.float32)
+    ids = [f"id{i}" for i in range(50)]
+    items = list(zip(ids, vectors.tolist())) + [("corto", [1.0])]
+
+    exported = export_snapshot(items, str(tmp_path), dim=16, batch_size=7)
+    snapshot = open_snapshot(str(tmp_path))
+
+    assert snapshot.version == exported.version
+    assert snapshot.meta["count"] == 50
+    assert isinstance(snapshot.vectors, np.memmap)
+    query = rng.normal(size=16)
+    assert snapshot.index().search(query, k=5) == [
+        (chunk_id, pytest.approx(dist, abs=1e-5)) for chunk_id, dist in VectorIndex(ids, vectors).search(query, k=5)
+    ]
+
+def test_snapshot_repository_follows_current(tmp_path):
+    """El repositorio sirve el snapshot recién publicado y cambia su versión"""
+    import os
+    from app.repositories.vector_snapshot import CURRENT_FILE, SnapshotChunkRepository, export_snapshot
+    from fakes import ListRepository
+
+    first = export_snapshot([("a", [1.0, 0.0])], str(tmp_path), dim=2)
+    repo = SnapshotChunkRepository(ListRepository([]), str(tmp_path))
+    assert repo.version == first.version
+
+    second = export_snapshot([("a", [1.0, 0.0]), ("b", [0.0, 1.0])], str(tmp_path), dim=2)
+    # Garantiza un mtime distinto aunque ambas publicaciones caigan en el mismo tick del reloj
+    pointer = tmp_path / CURRENT_FILE
+    os.utime(pointer, ns=(pointer.stat().st_atime_ns, pointer.stat().st_mtime_ns + 1_000_000))
+
+    assert repo.version == second.version
+    assert [chunk_id for chunk_id, _ in repo.get_vectors()] == ["a", "b"]
+    assert len(repo.load_index(dim=2)) == 2
+
+def test_ivf_full_probe_equals_exact():
+    """Con n_probe = n_lists el índice IVF devuelve lo mismo que el exacto"""
+    from app.services.vector_index import IVFIndex, build_index
+
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(400, 32)).astype(np.float32)
+    exact = VectorIndex([str(i) for i in range(400)], vectors)
+    ivf = build_index(exact, kind="ivf", n_lists=16, n_probe=16)
+
+    assert isinstance(ivf, IVFIndex)
+    query = rng.normal(size=32)
+    assert [i for i, _ in ivf.search(query, k=10)] == [i for i, _ in exact.search(query, k=10)]
+
+def _mapped(tmp_path, vectors):
+    """Índice float32 sobre un mmap normalizado, como el que sirve un snapshot."""
+    from app.services.vector_index import normalize_rows
+    np.save(tmp_path / "vectors.npy", normalize_rows(vectors))
+    mapped = np.load(tmp_path / "vectors.npy", mmap_mode="r")
+    return VectorIndex([str(i) for i in range(len(vectors))], mapped, normalized=True)
+
+def test_quantized_storage_keeps_ranking(tmp_path):
+    """float16/int8 reducen memoria y, con re-puntuación sobre un snapshot, conservan el top-k exacto"""
+    from app.services.vector_index import build_index
+
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(300, 64)).astype(np.float32)
+    exact = VectorIndex([str(i) for i in range(300)], vectors)
+    mapped = _mapped(tmp_path, vectors)
+    query = rng.normal(size=64)
+    expected = [i for i, _ in exact.search(query, k=5)]
+
+    assert mapped.nbytes == 0
+    for dtype, ratio in (("float16", 2), ("int8", 4)):
+        quantized = build_index(exact, dtype=dtype)
+        assert quantized.nbytes <= exact.nbytes / ratio * 1.1
+        # En memoria la re-puntuación no guarda una copia float32 adicional
+        assert build_index(exact, dtype=dtype, rescore=4).nbytes == quantized.nbytes
+        rescored = build_index(mapped, dtype=dtype, rescore=4)
+        assert rescored.nbytes == quantized.nbytes
+        assert [i for i, _ in rescored.search(query, k=5)] == expected
+        # La conversión por bloques coincide con dequantizar la matriz entera
+        q = quantized._prepare_query(query)
+        assert np.allclose(quantized._similarities(q), quantized._dequantize(slice(None)) @ q, atol=1e-6)
+        rows = np.array([299, 0, 150])
+        assert np.allclose(quantized._similarities(q, rows), quantized._similarities(q)[rows], atol=1e-6)
+
+def test_truncated_index_with_full_rerank(tmp_path):
+    """El índice truncado acepta consultas completas y el rerank usa todas las dimensiones"""
+    from app.services.vector_index import build_index
+
+    rng = np.random.default_rng(4)
+    vectors = rng.normal(size=(40, 32)).astype(np.float32)
+    exact = VectorIndex([str(i) for i in range(40)], vectors)
+    query = rng.normal(size=32)
+    expected = [(chunk_id, pytest.approx(dist, abs=1e-5)) for chunk_id, dist in exact.search(query, k=4)]
+
+    truncated = build_index(_mapped(tmp_path, vectors), truncate_dim=8, rescore=10)
+    assert truncated.dim == 32
+    assert truncated.search(query, k=4) == expected
+
+    # Construido desde Mongo (en memoria) conserva la matriz completa para el rerank
+    in_memory = build_index(exact, truncate_dim=8, rescore=10)
+    assert in_memory.nbytes == exact.nbytes + build_index(exact, truncate_dim=8).nbytes
+    assert in_memory.search(query, k=4) == expected
+
+def test_chat_service_renews_index_when_corpus_changes():
+    """El índice se renueva al cambiar la versión del repositorio, como muy tarde cada index_refresh_seconds"""
+    import time
+    from app.models.chunk import Chunk
+    from fakes import FixedEmbeddings, ListRepository, make_chat_service
+
+    class CountingRepository(ListRepository):
+        loads = 0
+
+        def load_index(self, dim=None):
+            self.loads += 1
+            return super().load_index(dim)
+
+    repo = CountingRepository([Chunk(_id="a", texto="uno", vector=[1.0, 0.0])], version="v1")
+    service = make_chat_service(repo, FixedEmbeddings([0.0, 1.0]), None, embedding_dimension=2, index_refresh_seconds=0.05)
+
+    assert service.retrieve("pregunta").chunks == []
+    repo.chunks = repo.chunks + [Chunk(_id="b", texto="dos", vector=[0.0, 1.0])]
+    # Dentro del intervalo se sigue usando el índice ya construido
+    assert service.retrieve("pregunta").chunks == []
+    time.sleep(0.06)
+    # Misma versión: se comprueba pero no se reconstruye
+    assert service.retrieve("pregunta").chunks == [] and repo.loads == 1
+
+    repo.version = "v2"
+    time.sleep(0.06)
+    assert [c.id for c in service.retrieve("pregunta").chunks] == ["b"]
+    assert repo.loads == 2 and service.corpus_version == ("v2", 1)
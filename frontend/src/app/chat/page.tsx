@@ -30,7 +30,11 @@ function ChatPageContent() {
     currentSessionId,
     sessions,
     loadingSessions,
+    hasMoreSessions,
+    hasOlderMessages,
     loadSession,
+    loadMoreSessions,
+    loadOlderMessages,
     createNewSession,
     deleteSession,
     updateSessionTitle,
@@ -173,6 +177,14 @@ function ChatPageContent() {
                     </div>
                   </div>
                 )}
+                {hasMoreSessions && (
+                  <button
+                    onClick={loadMoreSessions}
+                    className="w-full p-2 text-sm text-gray-500 dark:text-gray-400 hover:bg-gray-100 dark:hover:bg-gray-800 rounded-lg"
+                  >
+                    Cargar más
+                  </button>
+                )}
               </div>
             )}
           </div>
@@ -262,6 +274,16 @@ function ChatPageContent() {
               ref={listRef}
               className="h-full overflow-y-auto px-4 py-6 max-w-4xl mx-auto"
             >
+              {hasOlderMessages && (
+                <div className="text-center mb-4">
+                  <button
+                    onClick={loadOlderMessages}
+                    className="text-sm text-gray-500 dark:text-gray-400 hover:underline"
+                  >
+                    Cargar mensajes anteriores
+                  </button>
+                </div>
+              )}
               {messages.map((message) => (
                 <ChatMessageBubble key={message.id} message={message} />
               ))}
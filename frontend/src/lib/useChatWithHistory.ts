@@ -12,6 +12,11 @@ interface ChatSession {
   last_message_preview?: string;
 }
 
+interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
 interface ChatResponse {
   answer: string;
   images?: string[];
@@ -25,6 +30,7 @@ interface SessionResponse {
   created_at: string;
   updated_at: string;
   messages: ChatMessage[];
+  next_cursor: string | null;
 }
 
 export function useChatWithHistory() {
@@ -34,6 +40,9 @@ export function useChatWithHistory() {
   const [currentSessionId, setCurrentSessionId] = useState<number | null>(null);
   const [sessions, setSessions] = useState<ChatSession[]>([]);
   const [loadingSessions, setLoadingSessions] = useState(false);
+  // Cursores de la siguiente página (null cuando no quedan más)
+  const [sessionsCursor, setSessionsCursor] = useState<string | null>(null);
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null);
   const controller = useRef<AbortController | null>(null);
 
   // Crear headers con autenticación
@@ -64,8 +73,9 @@ export function useChatWithHistory() {
         }
       );
       if (res.ok) {
-        const sessionsData = await res.json();
-        setSessions(sessionsData);
+        const page: Page<ChatSession> = await res.json();
+        setSessions(page.items);
+        setSessionsCursor(page.next_cursor);
       } else {
         handleAuthError(res);
       }
@@ -76,6 +86,34 @@ export function useChatWithHistory() {
     }
   }, [token, getAuthHeaders]);
 
+  // Cargar la siguiente página de sesiones
+  const loadMoreSessions = useCallback(async () => {
+    if (!token || !sessionsCursor) return;
+
+    try {
+      const res = await fetch(
+        `${
+          process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000"
+        }/history/sessions?cursor=${encodeURIComponent(sessionsCursor)}`,
+        {
+          headers: getAuthHeaders(),
+        }
+      );
+      if (res.ok) {
+        const page: Page<ChatSession> = await res.json();
+        setSessions((prev) => [
+          ...prev,
+          ...page.items.filter((s) => !prev.some((p) => p.id === s.id)),
+        ]);
+        setSessionsCursor(page.next_cursor);
+      } else {
+        handleAuthError(res);
+      }
+    } catch (error) {
+      console.error("Error cargando más sesiones:", error);
+    }
+  }, [token, sessionsCursor, getAuthHeaders]);
+
   // Cargar mensajes de una sesión específica
   const loadSession = useCallback(
     async (sessionId: number) => {
@@ -93,6 +131,7 @@ export function useChatWithHistory() {
         if (res.ok) {
           const sessionData: SessionResponse = await res.json();
           setMessages(sessionData.messages);
+          setMessagesCursor(sessionData.next_cursor);
           setCurrentSessionId(sessionId);
         } else {
           handleAuthError(res);
@@ -104,9 +143,37 @@ export function useChatWithHistory() {
     [token, getAuthHeaders]
   );
 
+  // Cargar mensajes anteriores de la sesión actual
+  const loadOlderMessages = useCallback(async () => {
+    if (!token || !currentSessionId || !messagesCursor) return;
+
+    try {
+      const res = await fetch(
+        `${
+          process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000"
+        }/history/sessions/${currentSessionId}/messages?cursor=${encodeURIComponent(
+          messagesCursor
+        )}`,
+        {
+          headers: getAuthHeaders(),
+        }
+      );
+      if (res.ok) {
+        const page: Page<ChatMessage> = await res.json();
+        setMessages((m) => [...page.items, ...m]);
+        setMessagesCursor(page.next_cursor);
+      } else {
+        handleAuthError(res);
+      }
+    } catch (error) {
+      console.error("Error cargando mensajes anteriores:", error);
+    }
+  }, [token, currentSessionId, messagesCursor, getAuthHeaders]);
+
   // Crear nueva sesión
   const createNewSession = useCallback(() => {
     setMessages([]);
+    setMessagesCursor(null);
     setCurrentSessionId(null);
   }, []);
 
@@ -274,8 +341,12 @@ export function useChatWithHistory() {
     currentSessionId,
     sessions,
     loadingSessions,
+    hasMoreSessions: sessionsCursor !== null,
+    hasOlderMessages: messagesCursor !== null,
     sendMessage,
     loadSession,
+    loadMoreSessions,
+    loadOlderMessages,
     createNewSession,
     deleteSession,
     updateSessionTitle,